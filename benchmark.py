@@ -0,0 +1,338 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+
+import paper_rename
+
+# 合成論文に使う語彙
+TITLE_WORDS = [
+    "Attention", "Memory", "Learning", "Neural", "Networks", "Efficient", "Scalable", "Transformers",
+    "Retrieval", "Graph", "Reasoning", "Language", "Models", "Optimization", "Sparse", "Adaptive",
+    "Representation", "Inference", "Generative", "Robust", "Contrastive", "Diffusion", "Recurrent",
+    "Multimodal", "Reinforcement", "Compression", "Distillation", "Benchmark", "Alignment",
+]
+SUBTITLE_PREFIXES = ["Towards", "Using", "For", "With", "On", "A Study of", "Learning"]
+FIRST_NAMES = ["Ali", "Hongyin", "Maria", "John", "Wei", "Sofia", "Kenji", "Amira", "Lucas", "Priya", "Jonas", "Mei"]
+LAST_NAMES = ["Behrouz", "Luo", "Garcia", "Smith", "Zhang", "Rossi", "Tanaka", "Haddad", "Martin", "Patel", "Berg", "Chen"]
+AFFILIATIONS = ["University of Tokyo", "Institute for Advanced Study", "Department of Computer Science, MIT",
+                "Google Research", "Stanford University"]
+BODY_WORDS = ["the", "model", "we", "propose", "results", "show", "that", "our", "method", "improves",
+              "accuracy", "on", "several", "tasks", "while", "reducing", "cost", "and", "memory", "usage"]
+
+def _escape_pdf_text(text):
+    """PDFの文字列リテラル用にエスケープする"""
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def build_pdf(pages, info=None, padding_bytes=0):
+    """外部ライブラリを使わずに最小限のPDFを作成する
+    
+    pagesは各ページの (フォントサイズ, x, y, 文字列) のリスト。
+    padding_bytesを指定するとスキャン画像を模した無圧縮の画像を1ページ目に埋め込む。
+    """
+    objects = []
+    
+    def add(body):
+        objects.append(body)
+        return len(objects)
+    
+    catalog_id = add(None)
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    image_id = None
+    if padding_bytes > 0:
+        width = 1024
+        height = max(1, padding_bytes // width)
+        # 乱数のブロックを繰り返して、圧縮されにくい大きな画像データを再現可能に作る
+        rng = random.Random(padding_bytes)
+        block = bytes(rng.getrandbits(8) for _ in range(64 * 1024))
+        data = (block * (width * height // len(block) + 1))[:width * height]
+        image_id = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+                       b" /BitsPerComponent 8 /Length %d >>\nstream\n" % (width, height, len(data))
+                       + data + b"\nendstream")
+    
+    page_ids = []
+    for index, lines in enumerate(pages):
+        content = []
+        if index == 0 and image_id:
+            content.append("q 1 0 0 1 0 0 cm /Im1 Do Q")
+        for size, x, y, text in lines:
+            content.append(f"BT /F1 {size} Tf {x} {y} Td ({_escape_pdf_text(text)}) Tj ET")
+        stream = "\n".join(content).encode('cp1252', errors='replace')
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        resources = b"<< /Font << /F1 %d 0 R >>" % font_id
+        if index == 0 and image_id:
+            resources += b" /XObject << /Im1 %d 0 R >>" % image_id
+        resources += b" >>"
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Resources %s /Contents %d 0 R >>"
+                            % (pages_id, resources, content_id)))
+    
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    
+    info_id = None
+    if info:
+        entries = b" ".join(b"/%s (%s)" % (key.encode(), _escape_pdf_text(value).encode('cp1252', errors='replace'))
+                            for key, value in info.items())
+        info_id = add(b"<< " + entries + b" >>")
+    
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for object_id, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % object_id + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    trailer = b"<< /Size %d /Root %d 0 R" % (len(objects) + 1, catalog_id)
+    if info_id:
+        trailer += b" /Info %d 0 R" % info_id
+    output += b"trailer\n" + trailer + b" >>\nstartxref\n%d\n%%%%EOF\n" % xref_offset
+    return bytes(output)
+
+def _synthetic_paper(rng):
+    """ランダムな論文のタイトル・副題・著者を作成する"""
+    title = " ".join(rng.sample(TITLE_WORDS, rng.randint(3, 7)))
+    subtitle = None
+    if rng.random() < 0.4:
+        subtitle = f"{rng.choice(SUBTITLE_PREFIXES)} {' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 4)))}"
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(rng.randint(1, 5))]
+    return title, subtitle, authors
+
+def _body_lines(rng, two_column, top):
+    """本文の行（1段組または2段組）を作成する"""
+    lines = []
+    columns = [72, 320] if two_column else [72]
+    width = 6 if two_column else 12
+    for x in columns:
+        y = top
+        while y > 60:
+            lines.append((10, x, y, " ".join(rng.choice(BODY_WORDS) for _ in range(width))))
+            y -= 12
+    return lines
+
+def generate_corpus(corpus_dir, count, seed=42, duplicates=0, large_files=0, large_size_mb=20):
+    """再現可能な合成論文コーパスを作成し、作成したファイルの情報を返す"""
+    rng = random.Random(seed)
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for i in range(count):
+        title, subtitle, authors = _synthetic_paper(rng)
+        layout = rng.choice(['single_line', 'title_colon_subtitle', 'title_then_subtitle'])
+        two_column = rng.random() < 0.5
+        with_metadata = rng.random() < 0.4
+        
+        first_page = []
+        y = 720
+        if subtitle and layout == 'title_colon_subtitle':
+            first_page.append((18, 72, y, f"{title}: {subtitle}"))
+        else:
+            first_page.append((18, 72, y, title))
+            if subtitle and layout == 'title_then_subtitle':
+                y -= 22
+                first_page.append((16, 72, y, subtitle))
+        y -= 30
+        first_page.append((12, 72, y, ", ".join(authors)))
+        y -= 16
+        first_page.append((10, 72, y, rng.choice(AFFILIATIONS)))
+        y -= 24
+        first_page.append((11, 72, y, "Abstract"))
+        first_page.extend(_body_lines(rng, two_column, y - 16))
+        pages = [first_page, _body_lines(rng, two_column, 740)]
+        
+        info = None
+        if with_metadata:
+            full_title = f"{title}: {subtitle}" if subtitle else title
+            info = {'Title': full_title, 'Author': ", ".join(authors)}
+        
+        padding = large_size_mb * 1024 * 1024 if i < large_files else 0
+        if rng.random() < 0.5:
+            filename = f"{rng.randint(2001, 2512):04d}.{rng.randint(0, 99999):05d}v{rng.randint(1, 3)}.pdf"
+        else:
+            filename = f"paper_{i:05d}.pdf"
+        path = os.path.join(corpus_dir, filename)
+        if os.path.exists(path):
+            path = os.path.join(corpus_dir, f"{i:05d}_{filename}")
+        with open(path, 'wb') as f:
+            f.write(build_pdf(pages, info, padding))
+        entries.append({'path': path, 'title': title, 'subtitle': subtitle, 'author': authors[0],
+                        'layout': layout, 'two_column': two_column, 'metadata': with_metadata,
+                        'large': padding > 0})
+    
+    # 完全に同一内容の重複ファイル
+    for i in range(min(duplicates, count)):
+        source = entries[rng.randrange(count)]['path']
+        path = os.path.join(corpus_dir, f"duplicate_{i:05d}.pdf")
+        shutil.copyfile(source, path)
+        entries.append({'path': path, 'duplicate_of': source})
+    return entries
+
+def percentiles(values):
+    """処理時間の分布（ミリ秒）を返す"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    
+    return {'count': len(ordered), 'total_ms': sum(ordered) * 1000,
+            'p50_ms': rank(50) * 1000, 'p90_ms': rank(90) * 1000,
+            'p99_ms': rank(99) * 1000, 'max_ms': ordered[-1] * 1000}
+
+def run_benchmark(corpus_dir, work_dir, config):
+    """コーパスに対して各処理段階の時間を計測する
+    
+    本体と同じIngesterを通して重複チェック・キャッシュ・抽出（budgetを設定すればワーカープロセス）・
+    類似論文の判定・配置を行い、Ingesterがファイルごとに記録する段階別の処理時間を集計する
+    """
+    input_dir = os.path.join(work_dir, 'inbox')
+    output_folder = os.path.join(work_dir, 'outputs')
+    processed_folder = os.path.join(work_dir, 'processed')
+    # 元のコーパスを壊さないよう作業用フォルダにコピーしてから計測する
+    shutil.rmtree(work_dir, ignore_errors=True)
+    shutil.copytree(corpus_dir, input_dir)
+    os.makedirs(output_folder)
+    os.makedirs(processed_folder)
+    config = dict(config, output_folder=output_folder, processed_folder=processed_folder,
+                  quarantine_folder=os.path.join(work_dir, 'quarantine'))
+    
+    options = paper_rename.extractor_options(config)
+    hash_index = paper_rename.HashIndex(':memory:', output_folder)
+    cache = paper_rename.ExtractionCache(':memory:', config.get('cache_max_entries', 50000), options)
+    sandbox = None
+    budget = config.get('budget') or {}
+    if budget.get('timeout_seconds'):
+        sandbox = paper_rename.ExtractionSandbox(1, float(budget['timeout_seconds']))
+    stats = {'total': 0, 'processed': 0, 'skipped': 0, 'moved': 0, 'cached': 0,
+             'parsed': 0, 'second_page': 0, 'metadata_only': 0, 'over_budget': 0, 'quarantined': 0,
+             'near_duplicates': 0, 'newer_versions': 0}
+    ingester = paper_rename.Ingester(config, stats, hash_index, cache, sandbox=sandbox)
+    # 主な段階を先に並べ、抽出の内訳（pdf_open / extract_text など）は出てきた順に追加する
+    timings = {stage: [] for stage in ('hash', 'cache', 'extract', 'near_duplicate', 'filename', 'move', 'place')}
+    methods = {}
+    files = sorted(os.listdir(input_dir))
+    
+    started = time.perf_counter()
+    try:
+        for name in files:
+            pdf_path = os.path.join(input_dir, name)
+            
+            t = time.perf_counter()
+            screened = ingester.screen(pdf_path)
+            if screened is None:
+                # 重複ファイルは重複判定だけで終わる
+                timings['hash'].append(time.perf_counter() - t)
+                continue
+            fingerprint, cached, file_timings = screened
+            
+            info = cached
+            if info is None:
+                with paper_rename.timed(file_timings, 'extract'):
+                    info = ingester.extract(pdf_path, options)
+            methods[info['method']] = methods.get(info['method'], 0) + 1
+            
+            ingester.finish(pdf_path, fingerprint, info, file_timings)
+            for stage, seconds in file_timings.items():
+                timings.setdefault(stage, []).append(seconds)
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+        cache.close()
+        hash_index.close()
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'files': len(files),
+        'duplicates': stats['skipped'],
+        'near_duplicates': stats['near_duplicates'] + stats['newer_versions'],
+        'elapsed_sec': elapsed,
+        'files_per_sec': len(files) / elapsed if elapsed > 0 else 0.0,
+        'stages': {stage: percentiles(values) for stage, values in timings.items()},
+        'methods': methods,
+    }
+
+def compare_with_baseline(report, baseline, tolerance):
+    """ベースラインと比較し、許容範囲を超えて遅くなった項目のリストを返す"""
+    regressions = []
+    base_rate = baseline.get('files_per_sec', 0)
+    if base_rate and report['files_per_sec'] < base_rate * (1 - tolerance):
+        regressions.append(f"files/sec: {base_rate:.1f} → {report['files_per_sec']:.1f}")
+    for stage, values in report['stages'].items():
+        base_values = baseline.get('stages', {}).get(stage, {})
+        for key in ('p50_ms', 'p90_ms'):
+            base = base_values.get(key)
+            if base and values.get(key, 0) > base * (1 + tolerance):
+                regressions.append(f"{stage} {key}: {base:.2f} → {values[key]:.2f}")
+    return regressions
+
+def print_report(report):
+    print(f"ファイル数: {report['files']}（重複 {report['duplicates']}、類似論文 {report.get('near_duplicates', 0)}）")
+    print(f"処理時間: {report['elapsed_sec']:.2f}秒 / {report['files_per_sec']:.1f} files/sec")
+    print(f"{'stage':<16}{'count':>8}{'total_ms':>12}{'p50_ms':>10}{'p90_ms':>10}{'p99_ms':>10}{'max_ms':>10}")
+    for stage, values in report['stages'].items():
+        if not values:
+            continue
+        print(f"{stage:<16}{values['count']:>8}{values['total_ms']:>12.1f}{values['p50_ms']:>10.2f}"
+              f"{values['p90_ms']:>10.2f}{values['p99_ms']:>10.2f}{values['max_ms']:>10.2f}")
+    print("抽出方法:", ", ".join(f"{method}={count}" for method, count in sorted(report['methods'].items())))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="paper_rename.py のベンチマーク（合成論文コーパスを使用）")
+    parser.add_argument('--files', type=int, default=200, help="生成する論文数")
+    parser.add_argument('--seed', type=int, default=42, help="コーパス生成の乱数シード")
+    parser.add_argument('--duplicates', type=int, default=10, help="完全一致の重複ファイル数")
+    parser.add_argument('--large-files', type=int, default=2, help="スキャン画像相当の大きなファイル数")
+    parser.add_argument('--large-size-mb', type=int, default=20, help="大きなファイルのサイズ（MB）")
+    parser.add_argument('--corpus-dir', help="コーパスの保存先（既存なら再利用。省略時は一時フォルダ）")
+    parser.add_argument('--output', help="計測結果のJSONの出力先")
+    parser.add_argument('--save-baseline', help="計測結果をベースラインとして保存するパス")
+    parser.add_argument('--compare', help="比較するベースラインJSONのパス")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="劣化とみなす割合（既定 0.15 = 15%%）")
+    parser.add_argument('--engine', choices=paper_rename.EXTRACTION_ENGINES, default='text',
+                        help="抽出エンジン（設定ファイルのextraction_engineと同じ）")
+    parser.add_argument('--timeout', type=float, default=0,
+                        help="1ファイルあたりの抽出時間の上限（秒）。指定するとワーカープロセスで抽出する（budgetと同じ）")
+    args = parser.parse_args(argv)
+    
+    # 計測中はファイルごとのログを抑制する
+    paper_rename.logger.setLevel(logging.WARNING)
+    
+    temp_root = tempfile.mkdtemp(prefix='paper_rename_bench_')
+    try:
+        corpus_dir = args.corpus_dir or os.path.join(temp_root, 'corpus')
+        if not os.path.isdir(corpus_dir) or not os.listdir(corpus_dir):
+            generate_corpus(corpus_dir, args.files, args.seed, args.duplicates, args.large_files, args.large_size_mb)
+        
+        config = {'extraction_engine': args.engine, 'budget': {'timeout_seconds': args.timeout}}
+        report = run_benchmark(corpus_dir, os.path.join(temp_root, 'work'), config)
+        print_report(report)
+        
+        for path in (args.output, args.save_baseline):
+            if path:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+        
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(report, baseline, args.tolerance)
+            if regressions:
+                print("ベースラインより遅くなった項目:")
+                for line in regressions:
+                    print(f"  {line}")
+                return 1
+            print("ベースラインとの比較: 劣化なし")
+        return 0
+    finally:
+        shutil.rmtree(temp_root, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
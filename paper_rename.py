@@ -1,60 +1,721 @@
 import os
+import sys
+import errno
 import shutil
 import yaml
 import re
-from PyPDF2 import PdfReader
+import fnmatch
+from PyPDF2 import PdfReader, __version__ as PYPDF2_VERSION
 import logging
 from pathlib import Path
 import hashlib
+import mmap
+import argparse
+import json
+import heapq
+import cProfile
+from contextlib import contextmanager
+from collections import namedtuple
+from functools import lru_cache
+import sqlite3
+import time
+import asyncio
+import threading
+import queue
+import multiprocessing
+import multiprocessing.util
+import select
+import signal
+import struct
+import zlib
+import unicodedata
+import tempfile
+import io
+import zipfile
+import tarfile
+import socket
+import ctypes
+import ctypes.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+try:
+    import fcntl
+except ImportError:  # Windowsなど
+    fcntl = None
+try:
+    # フォントのエンコーディングとToUnicodeの解析はPyPDF2の内部関数を使う（PYPDF2_TESTED_VERSIONSで動作確認）
+    from PyPDF2._cmap import build_char_map
+except ImportError:  # 古いPyPDF2、または内部構成が変わったPyPDF2
+    build_char_map = None
 
 # ロギングの設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 抽出ヒューリスティックのバージョン（抽出結果が変わる修正をしたら上げる。キャッシュの無効化に使用）
+EXTRACTOR_VERSION = 3
+EXTRACTION_ENGINES = ('text', 'fontscan')
+# fontscanが使うPyPDF2の内部API（_cmap.build_char_map、ストリームの _data）を確認したバージョン
+PYPDF2_TESTED_VERSIONS = '3.0.x'
+
+@contextmanager
+def timed(timings, stage):
+    """処理時間を計測し、timings[stage] に秒数を加算する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
 def extract_title_and_author(pdf_path):
     """PDFから論文のタイトルと最初の著者を抽出する"""
+    info = extract_paper_info(pdf_path)
+    return info['title'], info['author']
+
+def extract_paper_info(pdf_path, incremental=True, metadata_fast_path=True, engine='text', stream=None):
+    """PDFからタイトル・副題・最初の著者と、それぞれに使われた抽出方法を抽出する
+    
+    streamを指定した場合（書庫内のPDFなど）はPDFをstreamから読み、pdf_pathはログとファイル名に基づく推定にだけ使う。
+    metadata_fast_pathがTrueの場合はまずInfo辞書だけを読み、十分なタイトルと著者があればページを解析しない。
+    engineが'fontscan'の場合は1ページ目上部のテキストをフォントサイズ付きで読み、不十分な場合のみ通常の抽出を行う。
+    incrementalがTrueの場合はまず1ページ目だけで抽出し、タイトルが見つからないか
+    著者名が検証を通らない場合のみ2ページ目のテキストを追加して抽出し直す
+    """
+    # 段階ごとの処理時間（秒）。結果と一緒に返して実行レポートに集計する
+    timings = {}
     try:
-        reader = PdfReader(pdf_path)
+        if metadata_fast_path:
+            with timed(timings, 'metadata'):
+                result = extract_from_metadata(pdf_path, stream)
+            if result is not None:
+                logger.info(f"抽出結果 - タイトル: {result['title']}")
+                logger.info(f"抽出結果 - 著者: {result['author']}")
+                return {'title': result['title'], 'subtitle': result['subtitle'], 'author': result['author'],
+                        'method': "title:metadata,author:metadata", 'pages': 0, 'timings': timings,
+                        'arxiv_id': find_arxiv_id(pdf_path), 'sketch': None, 'quick_hash': result.get('quick_hash')}
         
-        # PDF全体のテキストを取得（最初の2ページのみ）
-        text = ""
-        max_pages = min(2, len(reader.pages))
-        for i in range(max_pages):
-            page_text = reader.pages[i].extract_text()
-            if page_text:
-                text += page_text + "\n"
+        content_hashes = {}
+        with timed(timings, 'pdf_open'):
+            if stream is None:
+                # PdfReaderはどのみちファイル全体をメモリに読み込むため、ここで読み込んで
+                # キャッシュのキーに使うハッシュも計算する（重複判定のためにファイルを読み直さない）
+                with open(pdf_path, 'rb') as f:
+                    data = f.read()
+                content_hashes = {'quick_hash': quick_hash_of_stream(io.BytesIO(data), len(data)),
+                                  'hash': hashlib.md5(data).hexdigest()}
+                stream = io.BytesIO(data)
+                del data
+            reader = PdfReader(stream)
+            max_pages = min(2, len(reader.pages))
         
-        if not text:
-            logger.warning(f"PDFからテキストを抽出できませんでした: {pdf_path}")
-            return os.path.splitext(os.path.basename(pdf_path))[0], "Unknown"
+        def page_text(i):
+            with timed(timings, 'extract_text'):
+                text = reader.pages[i].extract_text()
+            return text + "\n" if text else ""
         
-        # タイトルと副題を分割して抽出
-        full_title, subtitle = extract_title_and_subtitle(text, reader.metadata)
+        def analyze(text, sized_lines=None):
+            with timed(timings, 'heuristics'):
+                return _extract_from_text(text, pdf_path, reader.metadata, sized_lines) if text else None
         
-        # 著者の抽出 - 複数の方法を試みる
-        author = extract_author(text, full_title, os.path.basename(pdf_path), reader.metadata)
+        result = None
+        sized_lines = None
+        if engine == 'fontscan' and max_pages > 0:
+            # 1ページ目のコンテンツストリームからテキスト表示演算子だけを読む
+            with timed(timings, 'fontscan'):
+                sized_lines = scan_first_page_lines(reader.pages[0])
+            text = first_page = sized_lines_text(sized_lines)
+            pages_used = 1
+            result = analyze(text, sized_lines)
+            if result is not None and (result['title_method'] == 'filename'
+                                       or not validate_author_name(result['author'])):
+                result = None
         
-        # 不要な文字や記号を除去、著者名の整形
-        full_title = re.sub(r'[\n\r\t]+', ' ', full_title).strip()
-        author = re.sub(r'[\n\r\t]+', ' ', author).strip()
+        if result is not None:
+            # フォントサイズ付きの走査だけで十分な結果が得られた
+            pass
+        elif incremental:
+            # 1ページ目だけで抽出を試みる
+            text = first_page = page_text(0) if max_pages > 0 else ""
+            pages_used = 1
+            result = analyze(text, sized_lines)
+            if max_pages > 1 and (result is None or result['title_method'] == 'filename'
+                                  or not validate_author_name(result['author'])):
+                text += page_text(1)
+                pages_used = 2
+                result = analyze(text, sized_lines)
+        else:
+            # PDF全体のテキストを取得（最初の2ページのみ）
+            text = first_page = page_text(0) if max_pages > 0 else ""
+            for i in range(1, max_pages):
+                text += page_text(i)
+            pages_used = max_pages
+            result = analyze(text, sized_lines)
         
-        # 長すぎる著者名は切り詰める
-        if len(author) > 50:
-            author = author[:47] + "..."
+        if result is None:
+            logger.warning(f"PDFからテキストを抽出できませんでした: {pdf_path}")
+            return {'title': os.path.splitext(os.path.basename(pdf_path))[0], 'subtitle': None,
+                    'author': "Unknown", 'method': "no_text", 'pages': pages_used, 'timings': timings,
+                    'arxiv_id': find_arxiv_id(pdf_path), 'sketch': None, **content_hashes}
         
-        logger.info(f"抽出結果 - タイトル: {full_title}")
-        logger.info(f"抽出結果 - 著者: {author}")
+        logger.info(f"抽出結果 - タイトル: {result['title']}")
+        logger.info(f"抽出結果 - 著者: {result['author']}")
         
-        return full_title, author
+        # バージョン違いなどの類似論文の判定に使う1ページ目のMinHash
+        with timed(timings, 'sketch'):
+            sketch = minhash_signature(first_page)
+        
+        method = f"title:{result['title_method']},author:{result['author_method']}"
+        return {'title': result['title'], 'subtitle': result['subtitle'], 'author': result['author'],
+                'method': method, 'pages': pages_used, 'timings': timings,
+                'arxiv_id': find_arxiv_id(pdf_path, first_page), 'sketch': sketch, **content_hashes}
         
     except Exception as e:
         logger.error(f"PDFの処理中にエラーが発生しました: {pdf_path} - {str(e)}")
         # エラーが発生した場合はファイル名をタイトルとして、著者は不明とする
         base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        return base_name, "Unknown"
+        return {'title': base_name, 'subtitle': None, 'author': "Unknown", 'method': "error", 'timings': timings}
+
+def extract_from_metadata(pdf_path, stream=None):
+    """PDFのトレーラーとInfo辞書だけを読み、タイトルと著者が十分なら結果を返す（不十分ならNone）
+    
+    ファイルはmmapで開くため、ページのコンテンツストリームは読み込まれない（streamを指定した場合はstreamから読む）。
+    結果は通常の抽出でメタデータが採用される場合と同じになる。
+    """
+    def from_metadata(source):
+        metadata = PdfReader(source).metadata
+        if not metadata:
+            return None
+        # 本文テキストなしでヒューリスティックを適用し、両方ともメタデータから得られた場合のみ採用
+        # （Info辞書の値は参照時に読み込まれるため、ファイルを閉じる前に行う）
+        return _extract_from_text("", pdf_path, metadata)
+    
+    try:
+        if stream is not None:
+            result = from_metadata(stream)
+        else:
+            with open(pdf_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    result = from_metadata(mm)
+                    if result is not None:
+                        # インデックスに登録する部分ハッシュ（先頭と末尾のブロックだけを読む）
+                        result['quick_hash'] = quick_hash_of_stream(mm, len(mm))
+        if result is None:
+            return None
+    except Exception as e:
+        logger.debug(f"メタデータの読み込みに失敗したため通常の抽出を行います: {pdf_path} - {str(e)}")
+        return None
+    
+    if result['title_method'] != 'metadata' or result['author_method'] != 'metadata':
+        return None
+    if not validate_author_name(result['author']):
+        return None
+    return result
+
+# コンテンツストリームの字句（コメント、辞書の区切り、16進文字列、配列の区切り、名前、数値、演算子）
+CONTENT_TOKEN_RE = re.compile(
+    rb'[\x00\t\n\x0c\r ]*(?:(%[^\r\n]*)|(<<|>>)|<([0-9A-Fa-f\x00\t\n\x0c\r ]*)>|([\[\]{}])|(/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)'
+    rb'|([+-]?(?:\d+\.?\d*|\.\d+))|([^\x00\t\n\x0c\r ()<>\[\]{}/%]+)|(\())'
+)
+LITERAL_ESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f'}
+# インライン画像の終わり
+INLINE_IMAGE_END_RE = re.compile(rb'[\x00\t\n\x0c\r ]EI(?=[\x00\t\n\x0c\r ]|$)')
+# 展開済みのデータがこれだけ溜まるまで字句解析を始めない（末尾で途切れた字句を避けるため）
+CONTENT_READ_AHEAD = 4096
+# ページの上からこの割合までにあるテキストだけを集める
+FONTSCAN_TOP_FRACTION = 0.5
+# 範囲外のテキストがこの回数続いたら走査を打ち切る
+FONTSCAN_STOP_AFTER = 50
+
+# フォントサイズ付きの行（テキスト、実際の文字の大きさ、ベースラインのy座標）
+SizedLine = namedtuple('SizedLine', ['text', 'size', 'y'])
+
+def iter_content_chunks(page):
+    """ページのコンテンツストリームを展開しながら少しずつ返す（Flateのみのストリームは必要な分だけ展開）"""
+    contents = page.get('/Contents')
+    if contents is None:
+        return
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, list) else [contents]
+    for stream in streams:
+        stream = stream.get_object()
+        filters = stream.get('/Filter')
+        if isinstance(filters, list) and len(filters) == 1:
+            filters = filters[0]
+        # 展開前のデータはPyPDF2の内部属性（3.0.x）のため、なければget_data()で一度に展開する
+        raw = getattr(stream, '_data', None)
+        if filters == '/FlateDecode' and not stream.get('/DecodeParms') and isinstance(raw, bytes):
+            decompressor = zlib.decompressobj()
+            for start in range(0, len(raw), 16 * 1024):
+                chunk = decompressor.decompress(raw[start:start + 16 * 1024])
+                if chunk:
+                    yield chunk
+            yield decompressor.flush()
+        else:
+            yield stream.get_data()
+        # 複数のストリームは空白で区切られているものとして連結する
+        yield b'\n'
+
+def _read_literal_string(buf, pos):
+    """pos（開き括弧の次）から始まる文字列を読み、(バイト列, 終わりの位置) を返す（途切れていればNone）"""
+    out = bytearray()
+    depth = 1
+    end = len(buf)
+    while pos < end:
+        c = buf[pos]
+        if c == 0x5c:  # バックスラッシュ
+            if pos + 1 >= end:
+                return None
+            n = buf[pos + 1]
+            if n in LITERAL_ESCAPES:
+                out += LITERAL_ESCAPES[n]
+                pos += 2
+            elif 0x30 <= n <= 0x37:
+                digits = re.match(rb'[0-7]{1,3}', buf[pos + 1:pos + 4]).group()
+                out.append(int(digits, 8) & 0xff)
+                pos += 1 + len(digits)
+            elif n in (0x0a, 0x0d):
+                pos += 2 if buf[pos + 1:pos + 3] != b'\r\n' else 3
+            else:
+                out.append(n)
+                pos += 2
+            continue
+        if c == 0x28:
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(out), pos + 1
+        out.append(c)
+        pos += 1
+    return None
+
+def iter_content_operations(chunks):
+    """コンテンツストリームの (演算子, オペランドのリスト) を順に返す
+    
+    文字列は bytes、数値は float、名前は '/' 付きの str、配列は list として返す。
+    辞書のオペランド（マーク付きコンテンツのプロパティなど）は中身を読まずにNoneとして扱う
+    """
+    chunks = iter(chunks)
+    state = {'buf': b'', 'final': False}
+    
+    def more(pos):
+        """読み終えた部分を捨てて次の展開済みデータを追加する（ストリームの終わりならFalse）"""
+        state['buf'] = state['buf'][pos:]
+        for chunk in chunks:
+            state['buf'] += chunk
+            return True
+        state['final'] = True
+        return False
+    
+    pos = 0
+    operands = []
+    arrays = []
+    dict_depth = 0
+    while True:
+        buf = state['buf']
+        if not state['final'] and len(buf) - pos < CONTENT_READ_AHEAD:
+            more(pos)
+            pos = 0
+            continue
+        match = CONTENT_TOKEN_RE.match(buf, pos)
+        if match is None:
+            if not buf[pos:].strip():
+                return
+            # 不正なバイトは読み飛ばす
+            pos += 1
+            continue
+        comment, dict_mark, hex_string, bracket, name, number, word, paren = match.groups()
+        token_end = match.end()
+        value = None
+        has_value = True
+        if paren is not None:
+            literal = _read_literal_string(buf, token_end)
+            if literal is None:
+                # 文字列の途中でデータが途切れている
+                if not more(pos):
+                    return
+                pos = 0
+                continue
+            value, token_end = literal
+        elif hex_string is not None:
+            digits = re.sub(rb'[^0-9A-Fa-f]', b'', hex_string)
+            value = bytes.fromhex((digits + b'0' if len(digits) % 2 else digits).decode('ascii'))
+        elif number is not None:
+            value = float(number)
+        elif name is not None:
+            value = name.decode('latin-1')
+        elif dict_mark is not None:
+            dict_depth = max(0, dict_depth + (1 if dict_mark == b'<<' else -1))
+            has_value = dict_depth == 0 and dict_mark == b'>>'
+        elif bracket == b'[':
+            arrays.append([])
+            has_value = False
+        elif bracket == b']':
+            has_value = bool(arrays)
+            value = arrays.pop() if arrays else None
+        elif word is not None and not dict_depth and not arrays:
+            has_value = False
+            if word == b'BI':
+                # インライン画像のバイナリは読み飛ばす
+                end = INLINE_IMAGE_END_RE.search(buf, token_end)
+                while end is None:
+                    if not more(pos):
+                        return
+                    buf, token_end, pos = state['buf'], token_end - pos, 0
+                    end = INLINE_IMAGE_END_RE.search(buf, token_end)
+                token_end = end.end()
+            else:
+                yield word, operands
+            operands = []
+        else:
+            has_value = False
+        pos = token_end
+        if has_value and not dict_depth:
+            (arrays[-1] if arrays else operands).append(value)
+
+def _matrix_multiply(m, n):
+    return [m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5]]
+
+def _font_widths(font):
+    """フォント辞書から (1文字のバイト数, 文字コード→幅（1/1000 em）, 既定の幅) を返す"""
+    if font is None:
+        return 1, {}, 500.0
+    # 辞書の[]による参照は間接参照を解決する（getは解決しない）
+    widths = {}
+    if font.get('/Subtype') == '/Type0':
+        descendant = font['/DescendantFonts'][0].get_object()
+        items = list(descendant['/W']) if '/W' in descendant else []
+        i = 0
+        # [最初のコード [幅 ...]] または [最初のコード 最後のコード 幅] の並び
+        while i + 1 < len(items):
+            first = int(items[i])
+            following = items[i + 1].get_object() if hasattr(items[i + 1], 'get_object') else items[i + 1]
+            if isinstance(following, list):
+                for offset, width in enumerate(following):
+                    widths[first + offset] = float(width)
+                i += 2
+            elif i + 2 < len(items):
+                for code in range(first, int(following) + 1):
+                    widths[code] = float(items[i + 2])
+                i += 3
+            else:
+                break
+        return 2, widths, float(descendant.get('/DW', 1000))
+    first_char = int(font.get('/FirstChar', 0))
+    for offset, width in enumerate(font['/Widths'] if '/Widths' in font else []):
+        widths[first_char + offset] = float(width)
+    return 1, widths, 500.0
+
+# 警告済みのcharmapへの切り替えの理由（同じ理由の2回目以降はデバッグログにする）
+_charmap_fallback_warned = set()
 
-def extract_title_and_subtitle(text, metadata=None):
-    """PDFからタイトルと副題を抽出する"""
+def _warn_charmap_fallback(reason, message):
+    """fontscanがフォントの解析をあきらめてcharmapで変換することを、理由ごとに1回だけ警告する"""
+    if reason in _charmap_fallback_warned:
+        logger.debug(message)
+        return
+    _charmap_fallback_warned.add(reason)
+    logger.warning(message)
+
+def _font_decoder(page, font_name, fonts):
+    """フォントのエンコーディングとToUnicodeを使い、バイト列を (文字列, 送り幅（1/1000 em）) に変換する関数を返す"""
+    if font_name in fonts:
+        return fonts[font_name]
+    encoding, char_map, font = 'charmap', {}, None
+    if build_char_map is None:
+        _warn_charmap_fallback('unavailable', f"PyPDF2 {PYPDF2_VERSION} に build_char_map がないため、"
+                               f"fontscanはフォントのエンコーディングを使わずに文字を変換します"
+                               f"（動作確認済み: PyPDF2 {PYPDF2_TESTED_VERSIONS}）")
+    else:
+        try:
+            _, _, encoding, char_map, font = build_char_map(font_name, 200.0, page)
+        except Exception as e:
+            _warn_charmap_fallback(type(e).__name__, f"フォント {font_name} のエンコーディングを解析できないため、"
+                                   f"charmapで文字を変換します: {str(e)}"
+                                   f"（PyPDF2 {PYPDF2_VERSION}、動作確認済み: {PYPDF2_TESTED_VERSIONS}）")
+    try:
+        code_bytes, widths, default_width = _font_widths(font)
+    except Exception:
+        code_bytes, widths, default_width = 1, {}, 500.0
+    
+    def decode(data):
+        if isinstance(encoding, str):
+            try:
+                text = data.decode(encoding, 'surrogatepass')
+            except Exception:
+                text = data.decode('utf-16-be' if encoding == 'charmap' else 'charmap', 'surrogatepass')
+        else:
+            text = ''.join(encoding[b] if b in encoding else chr(b) for b in data)
+        if code_bytes == 2:
+            codes = [data[i] << 8 | data[i + 1] for i in range(0, len(data) - 1, 2)]
+        else:
+            codes = data
+        return ''.join(char_map.get(c, c) for c in text), sum(widths.get(code, default_width) for code in codes)
+    
+    fonts[font_name] = decode
+    return decode
+
+def scan_first_page_lines(page, top_fraction=FONTSCAN_TOP_FRACTION):
+    """1ページ目のコンテンツストリームからテキスト表示演算子だけを読み、上部のテキストを行ごとに返す
+    
+    extract_text() と違いページ全体のレイアウトは組み立てず、各行の実際のフォントサイズ
+    （テキスト行列と座標変換行列を反映した大きさ）を SizedLine として返す。回転した文字
+    （arXivの余白のスタンプなど）は除外し、ページ上部を過ぎたテキストが続いたら読むのをやめる
+    """
+    try:
+        box = [float(v) for v in page.mediabox]
+        bottom, top = min(box[1], box[3]), max(box[1], box[3])
+    except Exception:
+        bottom, top = 0.0, 792.0
+    cutoff = top - (top - bottom) * top_fraction
+    fonts = {}
+    decode = None
+    font_size = 0.0
+    leading = 0.0
+    ctm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    ctm_stack = []
+    tm = tlm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    # 各行は [テキスト, フォントサイズ, ベースラインのy座標, 最後の文字の右端のx座標]
+    lines = []
+    below = 0
+    
+    def show(data):
+        """文字列を表示し、テキスト行列を文字の送り幅だけ進める"""
+        nonlocal tm, below
+        if decode is None:
+            return
+        text, width = decode(data)
+        m = _matrix_multiply(tm, ctm)
+        tm = _matrix_multiply([1.0, 0.0, 0.0, 1.0, width / 1000.0 * font_size, 0.0], tm)
+        # 回転・傾斜した文字は本文ではないため除外
+        if not text or abs(m[1]) > 1e-3 or abs(m[2]) > 1e-3 or m[3] <= 0:
+            return
+        size = round(font_size * m[3], 1)
+        x, y = m[4], m[5]
+        end_x = x + width / 1000.0 * font_size * m[0]
+        if y < cutoff or y > top:
+            below += 1
+            return
+        below = 0
+        # 同じベースラインの文字と、直前の行より小さい上付き・下付きの文字は同じ行として扱う
+        line = None
+        for candidate in lines[-1:-4:-1]:
+            dy = abs(candidate[2] - y)
+            if dy < max(size, candidate[1]) * 0.3 or (size < candidate[1] * 0.8 and dy < candidate[1] * 0.7
+                                                       and x >= candidate[3] - 1):
+                line = candidate
+                break
+        if line is not None:
+            # 前の文字との間隔が空いていれば単語の区切りとみなす
+            if x - line[3] > min(size, line[1]) * 0.15 and not line[0].endswith(' ') and not text.startswith(' '):
+                line[0] += ' '
+            line[0] += text
+            line[1] = max(line[1], size)
+            line[3] = end_x
+        else:
+            lines.append([text, size, y, end_x])
+    
+    for operator, operands in iter_content_operations(iter_content_chunks(page)):
+        try:
+            if operator == b'q':
+                ctm_stack.append(ctm)
+            elif operator == b'Q':
+                ctm = ctm_stack.pop() if ctm_stack else ctm
+            elif operator == b'cm':
+                ctm = _matrix_multiply([float(v) for v in operands[-6:]], ctm)
+            elif operator == b'BT':
+                tm = tlm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+            elif operator == b'Tf':
+                decode = _font_decoder(page, operands[-2], fonts)
+                font_size = float(operands[-1])
+            elif operator == b'TL':
+                leading = float(operands[-1])
+            elif operator == b'Tm':
+                tm = tlm = [float(v) for v in operands[-6:]]
+            elif operator in (b'Td', b'TD'):
+                tx, ty = float(operands[-2]), float(operands[-1])
+                if operator == b'TD':
+                    leading = -ty
+                tm = tlm = _matrix_multiply([1.0, 0.0, 0.0, 1.0, tx, ty], tlm)
+            elif operator in (b'T*', b"'", b'"'):
+                tm = tlm = _matrix_multiply([1.0, 0.0, 0.0, 1.0, 0.0, -leading], tlm)
+                if operator != b'T*' and isinstance(operands[-1], bytes):
+                    show(operands[-1])
+            elif operator == b'Tj':
+                if isinstance(operands[-1], bytes):
+                    show(operands[-1])
+            elif operator == b'TJ':
+                for item in operands[-1]:
+                    if isinstance(item, bytes):
+                        show(item)
+                    elif isinstance(item, float):
+                        # 字間の調整（1/1000 em単位で左に戻す）
+                        tm = _matrix_multiply([1.0, 0.0, 0.0, 1.0, -item / 1000.0 * font_size, 0.0], tm)
+        except (IndexError, TypeError, ValueError):
+            continue
+        if below >= FONTSCAN_STOP_AFTER and lines:
+            break
+    
+    return [SizedLine(CONTROL_WHITESPACE_RE.sub(' ', text).strip(), size, y)
+            for text, size, y, _ in lines if text.strip()]
+
+def _extract_from_text(text, pdf_path, metadata, sized_lines=None):
+    """抽出済みのテキストにタイトル・著者のヒューリスティックを適用する"""
+    info = {}
+    
+    # タイトルと副題を分割して抽出
+    full_title, subtitle = extract_title_and_subtitle(text, metadata, info, os.path.basename(pdf_path), sized_lines)
+    
+    # 著者の抽出 - 複数の方法を試みる
+    author = extract_author(text, full_title, os.path.basename(pdf_path), metadata, info)
+    
+    # 不要な文字や記号を除去、著者名の整形
+    full_title = CONTROL_WHITESPACE_RE.sub(' ', full_title).strip()
+    author = CONTROL_WHITESPACE_RE.sub(' ', author).strip()
+    
+    # 長すぎる著者名は切り詰める
+    if len(author) > 50:
+        author = author[:47] + "..."
+    
+    return {'title': full_title, 'subtitle': subtitle, 'author': author,
+            'title_method': info.get('title_method'), 'author_method': info.get('author_method')}
+
+# 抽出ヒューリスティックで使う正規表現（ファイルごとに再評価しないよう事前にコンパイルしておく）
+TITLE_EXCLUDE_RE = re.compile(r'(University|Institute|Department|Abstract|Introduction|Keywords|©|Email|http)', re.IGNORECASE)
+LEADING_ASCII_DIGIT_RE = re.compile(r'^[0-9]')
+SUBTITLE_START_RE = re.compile(r'^(for|of|in|on|with|using|a|an|the|toward)')
+TITLE_PATTERNS = [
+    re.compile(r'(?:Title|TITLE)[:\s]+(.*?)[\n\r]'),
+    re.compile(r'^([A-Z][^.!?]*[.!?])(?:\s|$)'),  # 文頭から最初のピリオドまで
+    re.compile(r'^\s*([A-Z][^.!?]{10,100}[.!?])')  # 十分な長さの文
+]
+ARXIV_ID_RE = re.compile(r'(\d{4}\.\d{5})(v\d+)?')
+PARENTHESES_RE = re.compile(r'\(.*?\)')
+EMAIL_RE = re.compile(r'\S+@\S+')
+DIGIT_RE = re.compile(r'\d')
+CAPITALIZED_NAME_RE = re.compile(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)')
+AUTHOR_PATTERNS = [
+    re.compile(r'(?:Author|AUTHORS|By)[:\s]+(.*?)[\n\r]'),
+    re.compile(r'(?:\n|\r)((?:[A-Z][a-z]+\s+)+[A-Z][a-z]+)(?:\n|\r|,)'),  # 名前のパターン (例: John Smith)
+    re.compile(r'([A-Z][a-z]+\s+[A-Z][a-z]+)(?:\s*,\s*\d|\s*\(\d)'),  # 名前の後にカンマか括弧付き数字
+    re.compile(r'([A-Z][a-z]+\s+[A-Z]\.\s*[A-Z][a-z]+)'),  # ミドルネームイニシャル付き
+    re.compile(r'([A-Z][a-z]+(?:-[A-Z][a-z]+)?\s+[A-Z][a-z]+)')  # ハイフン付き名前も対応
+]
+AUTHOR_GLOBAL_PATTERNS = [
+    re.compile(r'([A-Z][a-z]+\s+[A-Z]\.\s*[A-Z][a-z]+)'),  # ミドルネームイニシャル付き
+    re.compile(r'([A-Z][a-z]+\s+[A-Z][a-z]+)(?:\s*,\s*\d|\s*\(\d)'),  # 名前の後にカンマか括弧付き数字
+    re.compile(r'([A-Z][a-z]+\s+(?:[A-Z][a-z]+\s+){0,2}[A-Z][a-z]+)(?=\s*,|\s*and|\s*;|\s*\n)')  # 複数の単語で構成される名前
+]
+AUTHOR_LINE_EXCLUDE_RE = re.compile(r'(abstract|keywords|introduction|university|institute|^fig|table|copyright)')
+LEADING_DIGIT_RE = re.compile(r'^\d')
+SUBTITLE_START_UPPER_RE = re.compile(r'^(FOR|OF|IN|ON|WITH|USING|A|AN|THE|TOWARD)\s')
+AUTHOR_NAME_EXCLUDE_RE = re.compile(
+    'university|institute|department|abstract|introduction|keywords|copyright|rights|reserved|published'
+    '|submitted|received|accepted|revised'
+)
+NAME_WORD_RE = re.compile(r'[A-Z][a-z]+|[A-Z]\.')
+INITIAL_RE = re.compile(r'[A-Z]\.')
+PREPOSITIONS = frozenset(['for', 'of', 'in', 'on', 'with', 'using', 'by', 'to', 'at', 'from', 'and'])
+CONTROL_WHITESPACE_RE = re.compile(r'[\n\r\t]+')
+
+# 行の特徴（前後の空白を除いた行、タイトル候補か、著者行らしいか）
+LineFeatures = namedtuple('LineFeatures', ['text', 'title_candidate', 'author_line'])
+
+@lru_cache(maxsize=8)
+def leading_lines(text, count=50):
+    """テキストの先頭count行を分割する（同じテキストに対する分割は1回だけ行う）"""
+    return tuple(text.split('\n', count)[:count])
+
+@lru_cache(maxsize=4096)
+def classify_line(line):
+    """1行についてタイトル候補・著者行としての特徴をまとめて判定する"""
+    stripped = line.strip()
+    # 明らかに著者や所属などの行を除外し、ある程度の長さがあるものをタイトル候補とする
+    title_candidate = (20 <= len(stripped) <= 200
+                       and not TITLE_EXCLUDE_RE.search(stripped)
+                       and not stripped.startswith('Fig')
+                       and not LEADING_ASCII_DIGIT_RE.search(stripped))
+    return LineFeatures(stripped, title_candidate, validate_author_line(line))
+
+def _body_font_size(sized_lines):
+    """本文のフォントサイズ（文字数で重み付けした最頻値）"""
+    weights = {}
+    for line in sized_lines:
+        weights[line.size] = weights.get(line.size, 0) + len(line.text)
+    return max(weights, key=weights.get) if weights else None
+
+def _continues_block(previous, line):
+    """同じ大きさのフォントで行間が詰まっていれば、複数行にわたる見出しの続きとみなす"""
+    return abs(line.size - previous.size) <= 0.5 and 0 < previous.y - line.y < previous.size * 2
+
+def _join_block(text, line_text):
+    """見出しの続きの行を連結する（行末のハイフンは単語の途中の改行とみなす）"""
+    return text[:-1] + line_text if text.endswith('-') else f"{text} {line_text}"
+
+def _find_title_block(sized_lines):
+    """タイトルと副題の行の範囲を探し、(タイトル, 副題またはNone, 最初の行, 最後の行の次) を返す（なければNone）
+    
+    本文より大きいフォントのうち最大のものが使われた連続する行をタイトルとし、その直後にそれより小さく
+    本文より大きいフォントの行があれば副題とする
+    """
+    body_size = _body_font_size(sized_lines)
+    if body_size is None:
+        return None
+    candidates = [i for i, line in enumerate(sized_lines)
+                  if line.size > body_size * 1.1 and len(line.text) >= 3 and not ARXIV_ID_RE.search(line.text)
+                  and not TITLE_EXCLUDE_RE.search(line.text)]
+    if not candidates:
+        return None
+    largest = max(sized_lines[i].size for i in candidates)
+    first = next(i for i in candidates if sized_lines[i].size >= largest - 0.5)
+    
+    # 同じ大きさで行間が詰まっている続きの行は複数行のタイトルとして連結する
+    title = sized_lines[first].text
+    end = first + 1
+    while end < len(sized_lines) and _continues_block(sized_lines[end - 1], sized_lines[end]):
+        title = _join_block(title, sized_lines[end].text)
+        end += 1
+    if len(title) < 10:
+        return None
+    
+    subtitle = None
+    if end < len(sized_lines):
+        previous, line = sized_lines[end - 1], sized_lines[end]
+        if (body_size * 1.1 < line.size < previous.size - 0.5 and 0 < previous.y - line.y < previous.size * 1.5
+                and not classify_line(line.text).author_line):
+            subtitle = line.text
+            end += 1
+            while end < len(sized_lines) and _continues_block(sized_lines[end - 1], sized_lines[end]):
+                subtitle = _join_block(subtitle, sized_lines[end].text)
+                end += 1
+    return title, subtitle, first, end
+
+def title_from_sized_lines(sized_lines):
+    """フォントサイズからタイトルと副題を推測し、(タイトル, 副題またはNone) を返す（なければNone）"""
+    block = _find_title_block(sized_lines)
+    return block[:2] if block else None
+
+def sized_lines_text(sized_lines):
+    """フォントサイズ付きの行をテキストにする
+    
+    著者の抽出でタイトルの位置を探せるよう、タイトルと副題の行は「タイトル: 副題」の1行にまとめる
+    """
+    texts = [line.text for line in sized_lines]
+    block = _find_title_block(sized_lines)
+    if block:
+        title, subtitle, first, end = block
+        texts[first:end] = [f"{title}: {subtitle}" if subtitle else title]
+    return "".join(text + "\n" for text in texts)
+
+def extract_title_and_subtitle(text, metadata=None, info=None, filename=None, sized_lines=None):
+    """PDFからタイトルと副題を抽出する（infoを渡すと採用した抽出方法を記録する）
+    
+    sized_lines（scan_first_page_lines() の結果）を渡すと、レイアウトから推測する前に
+    フォントサイズが最大の行をタイトルとして使う
+    """
+    if info is None:
+        info = {}
     # タイトルの抽出方法 - 複数の方法を試みる
     title = None
     subtitle = None
@@ -71,24 +732,27 @@ def extract_title_and_subtitle(text, metadata=None):
                 subtitle = parts[1].strip() if len(parts) > 1 else None
             else:
                 title = metadata_title
+            info['title_method'] = 'metadata'
+    
+    # 方法2: フォントサイズからの抽出（コンテンツストリームを走査した場合のみ）
+    if not title and sized_lines:
+        font_title = title_from_sized_lines(sized_lines)
+        if font_title:
+            title, subtitle = font_title
+            if ':' in title and not subtitle:
+                parts = title.split(':', 1)
+                title = parts[0].strip()
+                subtitle = parts[1].strip() or None
+            info['title_method'] = 'fontsize'
     
-    # 方法2: 一般的な論文パターンからの抽出
+    # 方法3: 一般的な論文パターンからの抽出
     if not title:
-        # 最初の数行を分析
-        lines = text.split('\n')[:30]  # 最初の30行を対象
-        
-        # 空行を除去
-        lines = [line.strip() for line in lines if line.strip()]
-        
-        # タイトルになりそうな行を特定
+        # 最初の30行を対象に、タイトルになりそうな行を特定
         title_candidates = []
-        for line in lines:
-            # 明らかに著者や所属などの行を除外
-            if re.search(r'(University|Institute|Department|Abstract|Introduction|Keywords|©|Email|http)', line, re.IGNORECASE):
-                continue
-            # 通常著者名は短いので、ある程度の長さがあるものをタイトル候補とする
-            if 20 <= len(line) <= 200 and not line.startswith('Fig') and not re.search(r'^[0-9]', line):
-                title_candidates.append(line)
+        for line in leading_lines(text)[:30]:
+            features = classify_line(line)
+            if features.title_candidate:
+                title_candidates.append(features.text)
         
         if title_candidates:
             # タイトルが主題と副題に分かれているか確認（コロンや改行で区切られている場合）
@@ -104,20 +768,14 @@ def extract_title_and_subtitle(text, metadata=None):
                 if len(title_candidates) > 1 and len(title_candidates[1]) < len(title) * 1.5:
                     second_line = title_candidates[1]
                     # 副題の特徴: 主題より短く、"for", "of", "in", "on", "with", "using"などで始まることが多い
-                    if re.match(r'^(for|of|in|on|with|using|a|an|the|toward)', second_line.lower()):
+                    if SUBTITLE_START_RE.match(second_line.lower()):
                         subtitle = second_line
+            info['title_method'] = 'layout'
     
-    # 方法3: 特定のパターンマッチング
+    # 方法4: 特定のパターンマッチング
     if not title:
-        # タイトルのパターン
-        title_patterns = [
-            r'(?:Title|TITLE)[:\s]+(.*?)[\n\r]',
-            r'^([A-Z][^.!?]*[.!?])(?:\s|$)',  # 文頭から最初のピリオドまで
-            r'^\s*([A-Z][^.!?]{10,100}[.!?])'  # 十分な長さの文
-        ]
-        
-        for pattern in title_patterns:
-            match = re.search(pattern, text)
+        for pattern in TITLE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 matched_text = match.group(1).strip()
                 # コロンで区切られている場合は主題と副題に分割
@@ -127,11 +785,13 @@ def extract_title_and_subtitle(text, metadata=None):
                     subtitle = parts[1].strip() if len(parts) > 1 else None
                 else:
                     title = matched_text
+                info['title_method'] = 'pattern'
                 break
     
     # タイトルが見つからない場合はファイル名を使用
     if not title:
-        title = os.path.splitext(os.path.basename(pdf_path))[0]
+        info['title_method'] = 'filename'
+        title = os.path.splitext(filename)[0] if filename else "Unknown"
     
     # タイトルが異常に長い場合は切り詰める
     if title and len(title) > 150:
@@ -150,8 +810,10 @@ def extract_title_and_subtitle(text, metadata=None):
     
     return full_title, subtitle
 
-def extract_author(text, title, filename, metadata=None):
-    """PDFから著者情報を抽出する"""
+def extract_author(text, title, filename, metadata=None, info=None):
+    """PDFから著者情報を抽出する（infoを渡すと採用した抽出方法を記録する）"""
+    if info is None:
+        info = {}
     author = None
     
     # 方法1: メタデータからの抽出 (信頼性が低いので補助的に使用)
@@ -169,22 +831,26 @@ def extract_author(text, title, filename, metadata=None):
             else:
                 author = metadata_author
     
+    if author:
+        info['author_method'] = 'metadata'
+    
     # 方法2: ArXiv識別子からの著者情報抽出（arxivの論文の場合）
     if not author:
         arxiv_id = None
         # ファイル名からarxiv IDを検出
-        arxiv_match = re.search(r'(\d{4}\.\d{5})(v\d+)?', filename)
+        arxiv_match = ARXIV_ID_RE.search(filename)
         if arxiv_match:
             arxiv_id = arxiv_match.group(1)
             logger.info(f"ArXiv IDを検出: {arxiv_id}")
             
             # ページ内容からの著者検索（arxivの論文は特定のフォーマットを持つ）
-            lines = text.split('\n')[:50]  # 最初の50行を対象
+            lines = leading_lines(text)  # 最初の50行を対象
             
             # arxivの論文では通常タイトルの下に著者リストがある
             title_index = -1
+            stripped_title = title.strip() if title else None
             for i, line in enumerate(lines):
-                if title and title.strip() in line.strip():
+                if stripped_title and stripped_title in line.strip():
                     title_index = i
                     break
             
@@ -192,7 +858,7 @@ def extract_author(text, title, filename, metadata=None):
                 # タイトル直後の行を著者行として処理
                 potential_authors = lines[title_index + 1]
                 # 著者行の検証（一般的な著者リストの特徴）
-                if validate_author_line(potential_authors):
+                if classify_line(potential_authors).author_line:
                     # 一般的な著者リストの整理（カンマ、セミコロン、「and」で区切られている）
                     if ',' in potential_authors:
                         author = potential_authors.split(',')[0].strip()
@@ -206,14 +872,17 @@ def extract_author(text, title, filename, metadata=None):
                     
                     # 著者名の整形（括弧内の所属情報などを削除）
                     if author:
-                        author = re.sub(r'\(.*?\)', '', author).strip()
+                        author = PARENTHESES_RE.sub('', author).strip()
                         # 電子メールアドレスを削除
-                        author = re.sub(r'\S+@\S+', '', author).strip()
+                        author = EMAIL_RE.sub('', author).strip()
                 
                 # 著者名の検証（通常、著者名は短く、数字を含まない）
                 if author and not validate_author_name(author):
                     author = None  # 無効な著者名をリセット
     
+    if author and 'author_method' not in info:
+        info['author_method'] = 'arxiv'
+    
     # 方法3: タイトル後のテキストからの著者検索
     if not author:
         # タイトル後の短いテキスト部分から著者を探す
@@ -225,13 +894,13 @@ def extract_author(text, title, filename, metadata=None):
             author_text = text[title_index:title_index + 1000]  # より広い範囲で検索
             
             # まず数行を抽出
-            author_lines = author_text.split('\n')[:10]
+            author_lines = author_text.split('\n', 10)[:10]
             
             # 著者パターンをチェック
             for i, line in enumerate(author_lines):
-                if validate_author_line(line):
+                if classify_line(line).author_line:
                     # 名前らしきパターンを探す
-                    name_match = re.search(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)', line)
+                    name_match = CAPITALIZED_NAME_RE.search(line)
                     if name_match:
                         author = name_match.group(1).strip()
                         # 著者名を検証
@@ -239,7 +908,7 @@ def extract_author(text, title, filename, metadata=None):
                             break
                     
                     # カンマで区切られた名前を探す
-                    if ',' in line and not re.search(r'\d', line.split(',')[0]):
+                    if ',' in line and not DIGIT_RE.search(line.split(',', 1)[0]):
                         author = line.split(',')[0].strip()
                         # 著者名を検証
                         if validate_author_name(author):
@@ -247,16 +916,8 @@ def extract_author(text, title, filename, metadata=None):
             
             # 名前らしきパターンを正規表現で検索
             if not author:
-                author_patterns = [
-                    r'(?:Author|AUTHORS|By)[:\s]+(.*?)[\n\r]',
-                    r'(?:\n|\r)((?:[A-Z][a-z]+\s+)+[A-Z][a-z]+)(?:\n|\r|,)',  # 名前のパターン (例: John Smith)
-                    r'([A-Z][a-z]+\s+[A-Z][a-z]+)(?:\s*,\s*\d|\s*\(\d)',  # 名前の後にカンマか括弧付き数字
-                    r'([A-Z][a-z]+\s+[A-Z]\.\s*[A-Z][a-z]+)',  # ミドルネームイニシャル付き
-                    r'([A-Z][a-z]+(?:-[A-Z][a-z]+)?\s+[A-Z][a-z]+)'  # ハイフン付き名前も対応
-                ]
-                
-                for pattern in author_patterns:
-                    match = re.search(pattern, author_text)
+                for pattern in AUTHOR_PATTERNS:
+                    match = pattern.search(author_text)
                     if match:
                         potential_author = match.group(1).strip()
                         # 著者名を検証
@@ -275,25 +936,24 @@ def extract_author(text, title, filename, metadata=None):
                     author = author.split(' and ')[0].strip()
                 
                 # メールアドレスやその他の不要情報を削除
-                author = re.sub(r'\S+@\S+', '', author).strip()
-                author = re.sub(r'\(.*?\)', '', author).strip()
+                author = EMAIL_RE.sub('', author).strip()
+                author = PARENTHESES_RE.sub('', author).strip()
+    
+    if author and 'author_method' not in info:
+        info['author_method'] = 'after_title'
     
     # 方法4: 論文全体からの著者検索（最後の手段）
     if not author:
         # 学術論文で頻出する著者表記パターン
-        author_global_patterns = [
-            r'([A-Z][a-z]+\s+[A-Z]\.\s*[A-Z][a-z]+)',  # ミドルネームイニシャル付き
-            r'([A-Z][a-z]+\s+[A-Z][a-z]+)(?:\s*,\s*\d|\s*\(\d)',  # 名前の後にカンマか括弧付き数字
-            r'([A-Z][a-z]+\s+(?:[A-Z][a-z]+\s+){0,2}[A-Z][a-z]+)(?=\s*,|\s*and|\s*;|\s*\n)'  # 複数の単語で構成される名前
-        ]
-        
-        for pattern in author_global_patterns:
-            match = re.search(pattern, text[:3000])  # 最初の3000文字だけ対象
+        head_text = text[:3000]  # 最初の3000文字だけ対象
+        for pattern in AUTHOR_GLOBAL_PATTERNS:
+            match = pattern.search(head_text)
             if match:
                 potential_author = match.group(1).strip()
                 # 著者名を検証
                 if validate_author_name(potential_author):
                     author = potential_author
+                    info['author_method'] = 'global'
                     break
     
     # 著者が見つからない場合は "Unknown" を使用
@@ -301,11 +961,14 @@ def extract_author(text, title, filename, metadata=None):
         # metadata_authorがある場合はそれを使用
         if metadata_author and len(metadata_author) > 2:
             author = metadata_author
+            info['author_method'] = 'metadata_fallback'
         else:
             author = "Unknown"
+            info['author_method'] = 'unknown'
     
     return author
 
+@lru_cache(maxsize=4096)
 def validate_author_line(line):
     """著者行らしいかどうかを検証する"""
     line = line.strip()
@@ -316,11 +979,11 @@ def validate_author_line(line):
         return False
     
     # 2. 「Abstract」「Introduction」などの論文セクション見出しではない
-    if re.search(r'(abstract|keywords|introduction|university|institute|^fig|table|copyright)', line.lower()):
+    if AUTHOR_LINE_EXCLUDE_RE.search(line.lower()):
         return False
     
     # 3. 通常は数字から始まらない
-    if re.match(r'^\d', line):
+    if LEADING_DIGIT_RE.match(line):
         return False
     
     # 4. 通常は大文字小文字が混在する
@@ -328,11 +991,12 @@ def validate_author_line(line):
         return False
     
     # 5. FOR、OF、IN などで始まる場合は副題である可能性が高い
-    if re.match(r'^(FOR|OF|IN|ON|WITH|USING|A|AN|THE|TOWARD)\s', line.upper()):
+    if SUBTITLE_START_UPPER_RE.match(line.upper()):
         return False
     
     return True
 
+@lru_cache(maxsize=4096)
 def validate_author_name(name):
     """抽出された著者名が有効かどうかを検証する"""
     name = name.strip()
@@ -347,12 +1011,12 @@ def validate_author_name(name):
         return False
     
     # 3. 通常、著者名は数字を含まない
-    if re.search(r'\d', name):
+    if DIGIT_RE.search(name):
         return False
     
     # 4. 通常、著者名は大文字で始まる単語（一部の単語が大文字で始まる）
     # イニシャル（例：J. K. Rowling）もOK
-    if not re.search(r'[A-Z][a-z]+|[A-Z]\.', name):
+    if not NAME_WORD_RE.search(name):
         return False
     
     # 5. 通常、著者名が非常に長いフレーズの場合は無効
@@ -361,21 +1025,16 @@ def validate_author_name(name):
         return False
     
     # 6. 特定のキーワードを含む場合は著者名ではない可能性が高い
-    keywords = ['university', 'institute', 'department', 'abstract', 'introduction', 
-                'keywords', 'copyright', 'rights', 'reserved', 'published', 
-                'submitted', 'received', 'accepted', 'revised']
-    for keyword in keywords:
-        if keyword in name.lower():
-            return False
+    if AUTHOR_NAME_EXCLUDE_RE.search(name.lower()):
+        return False
     
     # 7. 一般的な前置詞や接続詞だけで構成されていないこと
-    prepositions = ['for', 'of', 'in', 'on', 'with', 'using', 'by', 'to', 'at', 'from', 'and']
-    if all(word.lower() in prepositions for word in words):
+    if all(word.lower() in PREPOSITIONS for word in words):
         return False
     
     # 8. 大文字のみの単語が含まれる場合は副題の可能性が高い
     if any(word.isupper() and len(word) > 1 for word in words):
-        if not re.match(r'[A-Z]\.', name):  # イニシャルは例外
+        if not INITIAL_RE.match(name):  # イニシャルは例外
             return False
     
     return True
@@ -390,149 +1049,3097 @@ def sanitize_filename(filename):
         sanitized = sanitized[:197] + "..."
     return sanitized
 
-def main():
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="論文PDFをタイトルと著者名でリネームする")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="抽出処理の並列プロセス数（省略時は設定ファイルのworkers、未設定なら1）")
+    parser.add_argument('--report', default=None,
+                        help="段階別の処理時間などをまとめた実行レポート（JSON）の出力先")
+    parser.add_argument('--slowest', type=int, default=20,
+                        help="実行レポートに含める処理時間の長いファイルの件数")
+    parser.add_argument('--profile-dir', default=None,
+                        help="抽出処理のcProfile結果（プロセスごとの .prof）を保存するフォルダ")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--watch', action='store_true',
+                      help="処理後も終了せず、入力フォルダに追加されたPDFを監視して処理し続ける")
+    mode.add_argument('--plan', metavar='MANIFEST', default=None,
+                      help="コピー・移動は行わず、抽出結果と実行予定をマニフェスト（JSON Lines）に書き出す")
+    mode.add_argument('--apply', metavar='MANIFEST', default=None,
+                      help="マニフェストのコピー・移動をジャーナルに記録しながら実行する（中断した場合は続きから再開）")
+    parser.add_argument('--full-scan', action='store_true',
+                        help="前回の走査結果を使わず、すべての入力フォルダを読み込み直す")
+    parser.add_argument('--pipeline', action='store_true', default=None,
+                        help="走査・重複チェック・抽出・配置を並行して実行する（設定ファイルのpipeline.enabledと同じ）")
+    parser.add_argument('--cluster', action='store_true', default=None,
+                        help="共有フォルダを複数のノードで同時に処理する（設定ファイルのcluster.enabledと同じ）")
+    parser.add_argument('--node-id', default=None,
+                        help="複数ノードで処理する場合のノードID（省略時はホスト名）")
+    parser.add_argument('--shard', metavar='I/N', default=None,
+                        help="N個に分割したファイルのうちI番目（0始まり）を優先して処理する（例: 0/3）")
+    return parser.parse_args(argv)
+
+def resolve_path(path):
+    """相対パスをスクリプトのディレクトリ基準の絶対パスに変換する"""
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+def load_config():
+    """YAML設定ファイルを読み込み、パスを絶対パスに変換した設定を返す"""
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+    if not os.path.exists(config_path):
+        logger.error(f"設定ファイルが見つかりません: {config_path}")
+        # サンプル設定ファイルを作成
+        sample_config = {
+            "input_folders": ["./papers"],  # 論文PDFが保存されているフォルダ
+            "output_folder": "./outputs",  # 出力先フォルダ
+            "processed_folder": "./processed_papers"  # 処理済みファイルの移動先フォルダ
+        }
+        with open(config_path, 'w', encoding='utf-8') as f:
+            yaml.dump(sample_config, f, default_flow_style=False, allow_unicode=True)
+        logger.info(f"サンプル設定ファイルを作成しました: {config_path}")
+        return None
+    
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    
+    # 複数の入力フォルダに対応
+    input_folders = config.get('input_folders', [])
+    # 後方互換性のため、古い形式のinput_folderもサポート
+    if not input_folders and 'input_folder' in config:
+        input_folders = [config.get('input_folder')]
+    
+    config['input_folders'] = [resolve_path(folder) for folder in input_folders]
+    config['output_folder'] = resolve_path(config.get('output_folder', './outputs'))
+    config['processed_folder'] = resolve_path(config.get('processed_folder', './processed_papers'))
+    config['quarantine_folder'] = resolve_path(config.get('quarantine_folder', './quarantine'))
+    return config
+
+def compile_exclude_patterns(patterns):
+    """除外するglobパターンを1つの正規表現にまとめる（パターンがなければNone）"""
+    patterns = [p.replace('\\', '/') for p in (patterns or []) if p]
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+def _dir_identity(path):
+    """フォルダを (デバイス, iノード) で識別する（存在しなければNone）"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+def unique_roots(input_folders):
+    """同じフォルダや他の入力フォルダの内側にあるフォルダを除いた入力フォルダを返す"""
+    roots = []
+    for folder_path in input_folders:
+        if not os.path.isdir(folder_path):
+            logger.warning(f"指定された入力フォルダが存在しません: {folder_path}")
+            continue
+        real = os.path.normcase(os.path.realpath(folder_path))
+        overlap = next((other for other, other_real in roots
+                        if real == other_real or real.startswith(other_real.rstrip(os.sep) + os.sep)), None)
+        if overlap is not None:
+            logger.info(f"他の入力フォルダと重複するためスキップします: {folder_path} (含むフォルダ: {overlap})")
+            continue
+        # 後から指定されたフォルダが既存のフォルダを含む場合は、既存のほうを除く
+        inner = [(other, other_real) for other, other_real in roots
+                 if other_real.startswith(real.rstrip(os.sep) + os.sep)]
+        for other, other_real in inner:
+            logger.info(f"他の入力フォルダに含まれるためスキップします: {other} (含むフォルダ: {folder_path})")
+            roots.remove((other, other_real))
+        roots.append((folder_path, real))
+    return [folder_path for folder_path, _ in roots]
+
+def iter_pdf_files(input_folders, exclude_folders=(), exclude_patterns=None, follow_symlinks=False, snapshot=None,
+                   verbose=True, archives=None):
+    """入力フォルダ内のPDFファイルを再帰的に列挙する
+    
+    os.scandir() で1フォルダずつ読みながら順に返すため、大きなフォルダでも列挙の完了を待たずに処理を始められる。
+    exclude_folders（出力フォルダ・処理済みフォルダなど）と、exclude_patternsに一致するファイル・フォルダは除外する。
+    snapshot（ScanSnapshot）を指定すると、前回から変更のないフォルダとファイルをスキップする。
+    archivesにリストを渡すと、見つかったzip・tarの書庫のパスをそこに追加する
+    """
+    excluded = {identity for identity in map(_dir_identity, exclude_folders) if identity}
+    exclude_re = compile_exclude_patterns(exclude_patterns)
+    # 訪問済みのフォルダ（シンボリックリンクのループや重複した入力フォルダを二重に走査しない）
+    visited = set()
+    
+    for folder_path in unique_roots(input_folders):
+        try:
+            st = os.stat(folder_path)
+        except OSError as e:
+            logger.warning(f"フォルダ情報を取得できません: {folder_path} - {str(e)}")
+            continue
+        identity = (st.st_dev, st.st_ino)
+        if identity in excluded or identity in visited:
+            logger.info(f"除外フォルダのためスキップします: {folder_path}")
+            continue
+        visited.add(identity)
+        
+        if verbose:
+            logger.info(f"フォルダを処理中: {folder_path}")
+        
+        # (フォルダのパス, 入力フォルダからの相対パス, mtime, 親フォルダ) を深さ優先で処理する
+        # mtimeはフォルダを読み込む前に取得したもの（読み込み中の変更は次回の走査で検出される）
+        stack = [(folder_path, '', st.st_mtime_ns, None)]
+        while stack:
+            dir_path, rel_dir, mtime_ns, parent = stack.pop()
+            subdirs = []
+            
+            if snapshot is not None and snapshot.unchanged(dir_path, mtime_ns):
+                # 変更のないフォルダは読み込まず、記録済みのサブフォルダだけを確認する
+                snapshot.skipped_dirs += 1
+                for child in snapshot.subdirs(dir_path):
+                    try:
+                        subdirs.append((child, rel_dir + os.path.basename(child), os.stat(child)))
+                    except OSError:
+                        continue
+            else:
+                known_files = snapshot.files(dir_path) if snapshot is not None else {}
+                kept_files = []
+                pending = False
+                try:
+                    with os.scandir(dir_path) as entries:
+                        for entry in entries:
+                            rel_path = rel_dir + entry.name
+                            if exclude_re and (exclude_re.match(os.path.normcase(entry.name))
+                                               or exclude_re.match(os.path.normcase(rel_path))):
+                                continue
+                            try:
+                                # DirEntryの種別はフォルダ読み込み時に取得済みのため、ファイルごとのstatは不要
+                                if entry.is_dir(follow_symlinks=follow_symlinks):
+                                    subdirs.append((entry.path, rel_path, entry.stat()))
+                                elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                                    if known_files:
+                                        file_st = entry.stat()
+                                        key = (file_st.st_size, file_st.st_mtime_ns, file_st.st_ino)
+                                        if known_files.get(entry.path) == key:
+                                            # 前回重複としてスキップしたファイルから変更がない
+                                            snapshot.skipped_files += 1
+                                            kept_files.append((entry.path, key))
+                                            continue
+                                    pending = True
+                                    yield entry.path
+                                elif archives is not None and is_archive_name(entry.name) and entry.is_file():
+                                    # 書庫は処理済みフォルダに移動するまで、次回の走査でもフォルダを読み込む
+                                    pending = True
+                                    archives.append(entry.path)
+                            except OSError as e:
+                                logger.warning(f"ファイル情報を取得できません: {entry.path} - {str(e)}")
+                except OSError as e:
+                    logger.warning(f"フォルダを読み込めません: {dir_path} - {str(e)}")
+                    continue
+                if snapshot is not None:
+                    snapshot.record_dir(dir_path, parent, mtime_ns, pending,
+                                        [path for path, _, _ in subdirs], kept_files)
+            
+            for child, rel_path, child_st in reversed(subdirs):
+                identity = (child_st.st_dev, child_st.st_ino)
+                if identity in excluded or identity in visited:
+                    continue
+                visited.add(identity)
+                stack.append((child, rel_path + '/', child_st.st_mtime_ns, dir_path))
+
+# ハッシュ計算時の読み込み単位と、部分ハッシュで読む先頭・末尾ブロックのサイズ
+HASH_CHUNK_SIZE = 1024 * 1024
+QUICK_HASH_BLOCK_SIZE = 64 * 1024
+
+def compute_file_hash(pdf_path):
+    """ファイルのMD5ハッシュを固定サイズのチャンク単位で計算する（失敗した場合はNone）"""
+    try:
+        md5 = hashlib.md5()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+    except Exception as e:
+        logger.error(f"ファイルハッシュ計算中にエラーが発生しました: {pdf_path} - {str(e)}")
+        return None
+
+def compute_quick_hash(pdf_path, size):
+    """ファイルの先頭と末尾のブロックだけを読んで部分ハッシュを計算する（失敗した場合はNone）"""
+    try:
+        with open(pdf_path, 'rb') as f:
+            return quick_hash_of_stream(f, size)
+    except Exception as e:
+        logger.error(f"部分ハッシュ計算中にエラーが発生しました: {pdf_path} - {str(e)}")
+        return None
+
+def quick_hash_of_stream(f, size):
+    """シーク可能なストリームの先頭と末尾のブロックから部分ハッシュを計算する"""
+    md5 = hashlib.md5(str(size).encode())
+    f.seek(0)
+    md5.update(f.read(QUICK_HASH_BLOCK_SIZE))
+    if size > QUICK_HASH_BLOCK_SIZE:
+        f.seek(max(QUICK_HASH_BLOCK_SIZE, size - QUICK_HASH_BLOCK_SIZE))
+        md5.update(f.read(QUICK_HASH_BLOCK_SIZE))
+    return md5.hexdigest()
+
+class FileFingerprint:
+    """重複判定用のファイル識別情報（サイズ→部分ハッシュ→全体ハッシュの順に必要な分だけ計算する）"""
+    
+    def __init__(self, path, size, quick_hash=None, full_hash=None, row_id=None, stat_key=None, processed_path=None):
+        self.path = path
+        self.size = size
+        self.row_id = row_id
+        # 登録済みファイルの処理済みフォルダの元ファイル（出力ファイルが移動・編集されても内容が変わらない）
+        self.processed_path = processed_path
+        # 走査スナップショット用の (サイズ, mtime, iノード)
+        self.stat_key = stat_key
+        self._quick_hash = quick_hash
+        self._full_hash = full_hash
+        # インデックスに書き戻す必要があるハッシュを計算したかどうか
+        self.dirty = False
+        # 重複判定のために読み込んだバイト数
+        self.bytes_read = 0
+    
+    @classmethod
+    def from_path(cls, path):
+        """ファイルサイズだけを取得して識別情報を作成する（失敗した場合はNone）"""
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"ファイルサイズの取得中にエラーが発生しました: {path} - {str(e)}")
+            return None
+        return cls(path, st.st_size, stat_key=(st.st_size, st.st_mtime_ns, st.st_ino))
+    
+    def source_path(self):
+        """ハッシュを計算するファイル（処理済みフォルダの元ファイルが残っていればそちらを読む）"""
+        if self.processed_path and os.path.exists(self.processed_path):
+            return self.processed_path
+        return self.path
+    
+    def quick_hash(self):
+        if self._quick_hash is None:
+            self._quick_hash = compute_quick_hash(self.source_path(), self.size)
+            self.dirty = self._quick_hash is not None
+            self.bytes_read += min(self.size, 2 * QUICK_HASH_BLOCK_SIZE)
+        return self._quick_hash
+    
+    def full_hash(self):
+        if self._full_hash is None:
+            self._full_hash = compute_file_hash(self.source_path())
+            self.dirty = self.dirty or self._full_hash is not None
+            self.bytes_read += self.size
+        return self._full_hash
+    
+    def learn_hashes(self, quick_hash, full_hash):
+        """抽出時に計算されたハッシュを取り込む（計算済みのものはそのまま）"""
+        if self._quick_hash is None:
+            self._quick_hash = quick_hash
+        if self._full_hash is None:
+            self._full_hash = full_hash
+    
+    def known_full_hash(self):
+        """計算済みの全体ハッシュを返す（未計算ならNone）"""
+        return self._full_hash
+    
+    def known_quick_hash(self):
+        """計算済みの部分ハッシュを返す（未計算ならNone）"""
+        return self._quick_hash
+    
+    def same_content(self, other):
+        """内容が同一かどうかを判定する（サイズ→部分ハッシュ→全体ハッシュの順に比較）"""
+        if self.size != other.size:
+            return False
+        other_quick = other.quick_hash()
+        if other_quick is not None and self.quick_hash() != other_quick:
+            return False
+        other_full = other.full_hash()
+        return other_full is not None and self.full_hash() == other_full
+
+def build_new_filename(title, author):
+    """タイトルと著者から新しいファイル名を作成する"""
+    return sanitize_filename(f"{title}({author}).pdf")
+
+# 出力ファイルの配置方法（autoはreflink→ハードリンク→コピーの順に、使えるものを選ぶ）
+PLACEMENT_STRATEGIES = {
+    'auto': ['reflink', 'hardlink', 'copy'],
+    'copy': ['copy'],
+    'hardlink': ['hardlink', 'copy'],
+    'reflink': ['reflink', 'copy'],
+}
+# LinuxのFICLONE ioctl（btrfs・XFSなどでcopy-on-writeのクローンを作成する）
+FICLONE = 0x40049409
+# ファイルシステムが対応していないことを示すエラー
+UNSUPPORTED_LINK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS,
+                           errno.EINVAL, errno.ENOTTY, errno.EMLINK}
+# 対応していないと分かった (配置方法, 元デバイス, 配置先デバイス) の組。以降は試行しない
+_unsupported_placements = set()
+
+def reflink_file(src, dst):
+    """copy-on-writeのクローンを作成する（対応していないファイルシステムではOSError）"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflinkはこの環境では使用できません")
+    with open(src, 'rb') as src_file, open(dst, 'xb') as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def copy_file_exclusive(src, dst):
+    """dstが存在しない場合のみコピーする（存在する場合はFileExistsError）"""
+    with open(src, 'rb') as src_file, open(dst, 'xb') as dst_file:
+        shutil.copyfileobj(src_file, dst_file, HASH_CHUNK_SIZE)
+    shutil.copystat(src, dst)
+
+def move_file(src, dst):
+    """ファイルを移動する（同じファイルシステム内ならアトミックなリネーム。dstは上書きされる）"""
     try:
-        # YAML設定ファイルの読み込み
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
-        if not os.path.exists(config_path):
-            logger.error(f"設定ファイルが見つかりません: {config_path}")
-            # サンプル設定ファイルを作成
-            sample_config = {
-                "input_folders": ["./papers"],  # 論文PDFが保存されているフォルダ
-                "output_folder": "./outputs",  # 出力先フォルダ
-                "processed_folder": "./processed_papers"  # 処理済みファイルの移動先フォルダ
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+def materialize_file(src, dst, strategy='auto'):
+    """srcと同じ内容のファイルをdstに作成し、実際に使った方法（reflink/hardlink/copy）を返す
+    
+    どの方法でもdstを排他的に作成するため、dstが既に存在する場合はFileExistsErrorになる
+    """
+    src_device = os.stat(src).st_dev
+    dst_device = os.stat(os.path.dirname(dst) or '.').st_dev
+    for method in PLACEMENT_STRATEGIES.get(strategy, PLACEMENT_STRATEGIES['auto']):
+        if method == 'copy':
+            copy_file_exclusive(src, dst)
+            return method
+        key = (method, src_device, dst_device)
+        if key in _unsupported_placements:
+            continue
+        try:
+            if method == 'hardlink':
+                os.link(src, dst)
+            else:
+                reflink_file(src, dst)
+            return method
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_LINK_ERRNOS:
+                raise
+            logger.debug(f"{method}は使用できないため次の方法を試します: {dst} - {str(e)}")
+            _unsupported_placements.add(key)
+    raise OSError(errno.EOPNOTSUPP, f"配置方法が不正です: {strategy}")
+
+class NameIndex:
+    """フォルダ内のファイル名の索引（起動時に1回だけ走査し、連番の衝突回避をstatなしで行う）"""
+    
+    def __init__(self, folder):
+        self.folder = folder
+        self.names = {os.path.normcase(name) for name in os.listdir(folder)}
+        # ファイル名ごとに次に試す連番
+        self.next_suffix = {}
+    
+    def candidates(self, filename):
+        """使用されていない候補名を「名前」「名前_1」「名前_2」…の順に返す"""
+        if os.path.normcase(filename) not in self.names:
+            yield filename
+        base_name, ext = os.path.splitext(filename)
+        key = os.path.normcase(filename)
+        counter = self.next_suffix.get(key, 1)
+        while True:
+            candidate = f"{base_name}_{counter}{ext}"
+            counter += 1
+            if os.path.normcase(candidate) not in self.names:
+                self.next_suffix[key] = counter
+                yield candidate
+    
+    def add(self, filename):
+        self.names.add(os.path.normcase(filename))
+    
+    def discard(self, filename):
+        self.names.discard(os.path.normcase(filename))
+    
+    def claim(self, filename, create):
+        """空いている名前でcreate(パス)を実行し、成功したパスとcreateの戻り値を返す
+        
+        createは排他的にファイルを作成する関数で、他のプロセスが先に同じ名前を使っていた場合は
+        FileExistsErrorとなるため、索引に追加して次の連番で再試行する
+        """
+        for name in self.candidates(filename):
+            path = os.path.join(self.folder, name)
+            try:
+                result = create(path)
+            except FileExistsError:
+                logger.debug(f"他のプロセスが作成したファイル名のため次の連番を試します: {path}")
+                self.add(name)
+                continue
+            self.add(name)
+            return path, result
+
+def reserve_file(path):
+    """空のファイルを排他的に作成して名前を確保する"""
+    with open(path, 'xb'):
+        pass
+
+def place_file(pdf_path, new_filename, output_folder, processed_folder, stats, report=None, timings=None,
+               strategy='auto', output_names=None, processed_names=None):
+    """リネームしたファイルを出力フォルダに配置し、元ファイルを処理済みフォルダに移動する
+    
+    出力ファイルを元ファイルからstrategyに従ってreflink・ハードリンク・コピーで作成してから、
+    元ファイルを処理済みフォルダへ移動する（同じファイルシステムならリンクとリネームのみでデータは書き込まれない）。
+    元ファイルだけが別のファイルシステムにある場合は、先に移動して一度だけ複製し、移動先から出力ファイルを作成する。
+    同名ファイルがある場合の連番はNameIndex（output_names・processed_names）で決め、
+    省略した場合はその場でフォルダを走査する。
+    timingsを渡すと配置・移動の処理時間を、reportを渡すと書き込んだバイト数を記録する。
+    出力先のパスと、元ファイルの移動先（移動できなかった場合はNone）を返す
+    """
+    if timings is None:
+        timings = {}
+    if output_names is None:
+        output_names = NameIndex(output_folder)
+    if processed_names is None:
+        processed_names = NameIndex(processed_folder)
+    
+    size = os.path.getsize(pdf_path)
+    source_device = os.stat(pdf_path).st_dev
+    output_device = os.stat(output_folder).st_dev
+    processed_device = os.stat(processed_folder).st_dev
+    
+    def materialize(source_path):
+        with timed(timings, 'place'):
+            return output_names.claim(new_filename, lambda path: materialize_file(source_path, path, strategy))
+    
+    def move_to_processed():
+        # 移動先の名前は空ファイルを排他的に作成して確保し、他のプロセスと同じ名前を使わないようにする
+        with timed(timings, 'move'):
+            processed_path, _ = processed_names.claim(os.path.basename(pdf_path), reserve_file)
+            try:
+                move_file(pdf_path, processed_path)
+            except Exception:
+                os.remove(processed_path)
+                processed_names.discard(os.path.basename(processed_path))
+                raise
+        if report is not None and source_device != processed_device:
+            report.add_bytes_written('move', size)
+        return processed_path
+    
+    processed_path = None
+    if source_device != output_device and processed_device == output_device:
+        # 先に移動して複製を1回にし、出力ファイルは移動先からリンクで作成する。
+        # 移動から出力ファイルの作成までの間に異常終了すると、元ファイルは処理済みフォルダにだけ残る
+        # （インデックスには登録されないため、入力フォルダに戻せば次回の実行で再処理される）
+        try:
+            processed_path = move_to_processed()
+        except Exception as e:
+            logger.error(f"ファイル移動中にエラーが発生しました: {pdf_path} - {str(e)}")
+        try:
+            output_path, method = materialize(processed_path or pdf_path)
+        except Exception:
+            # 出力ファイルを作成できなかった場合は元の場所に戻し、次回の実行で再処理できるようにする
+            if processed_path is not None:
+                move_file(processed_path, pdf_path)
+                processed_names.discard(os.path.basename(processed_path))
+            raise
+    else:
+        # 出力ファイルを作成するまで元ファイルを入力フォルダに残すため、途中で異常終了しても元ファイルは失われない
+        output_path, method = materialize(pdf_path)
+        try:
+            processed_path = move_to_processed()
+        except Exception as e:
+            logger.error(f"ファイル移動中にエラーが発生しました: {pdf_path} - {str(e)}")
+    
+    if method == 'copy':
+        logger.info(f"コピー完了: {output_path}")
+        if report is not None:
+            report.add_bytes_written('copy', size)
+    else:
+        logger.info(f"配置完了（{method}）: {output_path}")
+    stats['processed'] += 1
+    
+    if processed_path is not None:
+        logger.info(f"移動完了: {pdf_path} → {processed_path}")
+        stats['moved'] += 1
+    
+    return output_path, processed_path
+
+class HashIndex:
+    """コンテンツハッシュと処理結果を対応付けるSQLiteの永続インデックス（実行をまたいだ重複検出用）"""
+    
+    def __init__(self, db_path, output_folder):
+        self.db_path = db_path
+        self.output_folder = output_folder
+        # パイプライン処理では作成したスレッドとは別の専用スレッドから使う
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " size INTEGER NOT NULL,"
+                " quick_hash TEXT,"
+                " hash TEXT,"
+                " output_filename TEXT,"
+                " original_path TEXT,"
+                " title TEXT,"
+                " author TEXT,"
+                " processed_at REAL,"
+                " processed_path TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+            # 複数ノードで処理する場合に取り込んだ他のノードのジャーナルの位置
+            self.conn.execute("CREATE TABLE IF NOT EXISTS merged_journals (name TEXT PRIMARY KEY, offset INTEGER NOT NULL)")
+            # 類似論文の判定に使う特徴と、MinHashのLSHのバケット
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS papers ("
+                " file_id INTEGER PRIMARY KEY,"
+                " title_key TEXT,"
+                " arxiv_id TEXT,"
+                " arxiv_version INTEGER,"
+                " sketch BLOB)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS papers_title_key ON papers (title_key)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS papers_arxiv_id ON papers (arxiv_id)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS paper_bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, file_id INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS paper_bands_bucket ON paper_bands (band, bucket)")
+    
+    def candidates(self, size):
+        """同じサイズの登録済みファイルの識別情報を返す"""
+        rows = self.conn.execute(
+            "SELECT id, quick_hash, hash, output_filename, processed_path FROM files WHERE size = ?",
+            (size,)
+        ).fetchall()
+        return [
+            FileFingerprint(os.path.join(self.output_folder, output_filename), size,
+                            quick_hash=quick_hash, full_hash=file_hash, row_id=row_id, processed_path=processed_path)
+            for row_id, quick_hash, file_hash, output_filename, processed_path in rows
+        ]
+    
+    def size_hints(self):
+        """登録済みファイルの (サイズ, 部分ハッシュ) を返す（部分ハッシュが未計算ならNone）"""
+        return self.conn.execute("SELECT DISTINCT size, quick_hash FROM files").fetchall()
+    
+    def update_hashes(self, fingerprint):
+        """重複判定の途中で計算した登録済みファイルのハッシュを書き戻す"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE files SET quick_hash = ?, hash = ? WHERE id = ?",
+                (fingerprint.known_quick_hash(), fingerprint.known_full_hash(), fingerprint.row_id)
+            )
+        fingerprint.dirty = False
+    
+    def record(self, fingerprint, output_filename, original_path, title, author, processed_at=None,
+               processed_path=None):
+        """処理結果を1ファイル単位のトランザクションで登録し、登録したIDを返す
+        
+        processed_pathには処理済みフォルダに移動した元ファイルを渡す（出力ファイルが移動・編集された後も
+        未計算のハッシュをそこから計算できるようにする）
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO files"
+                " (size, quick_hash, hash, output_filename, original_path, title, author, processed_at, processed_path)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint.size, fingerprint.known_quick_hash(), fingerprint.known_full_hash(),
+                 output_filename, original_path, title, author, processed_at or time.time(), processed_path)
+            )
+        return cursor.lastrowid
+    
+    def record_paper(self, file_id, features):
+        """登録済みのファイルに類似論文の判定に使う特徴を追加する"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO papers (file_id, title_key, arxiv_id, arxiv_version, sketch) VALUES (?, ?, ?, ?, ?)",
+                (file_id, features.title_key, features.arxiv_id, features.arxiv_version, pack_sketch(features.sketch))
+            )
+            if features.sketch:
+                self.conn.executemany(
+                    "INSERT INTO paper_bands (band, bucket, file_id) VALUES (?, ?, ?)",
+                    [(band, bucket, file_id) for band, bucket in lsh_buckets(features.sketch)]
+                )
+    
+    def find_papers(self, features):
+        """タイトルと第一著者・arXiv ID・LSHのバケットのいずれかが一致する登録済みの論文を返す"""
+        file_ids = set()
+        if features.title_key:
+            file_ids.update(row[0] for row in self.conn.execute(
+                "SELECT file_id FROM papers WHERE title_key = ?", (features.title_key,)))
+        if features.arxiv_id:
+            file_ids.update(row[0] for row in self.conn.execute(
+                "SELECT file_id FROM papers WHERE arxiv_id = ?", (features.arxiv_id,)))
+        if features.sketch:
+            for band, bucket in lsh_buckets(features.sketch):
+                file_ids.update(row[0] for row in self.conn.execute(
+                    "SELECT file_id FROM paper_bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        for file_id in sorted(file_ids):
+            row = self.conn.execute(
+                "SELECT files.title, files.author, files.output_filename,"
+                " papers.title_key, papers.arxiv_id, papers.arxiv_version, papers.sketch"
+                " FROM papers JOIN files ON files.id = papers.file_id WHERE papers.file_id = ?",
+                (file_id,)
+            ).fetchone()
+            if row is not None:
+                yield row[0], row[1], row[2], PaperFeatures(row[3], row[4], row[5], unpack_sketch(row[6]))
+    
+    def journal_offset(self, name):
+        row = self.conn.execute("SELECT offset FROM merged_journals WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+    
+    def set_journal_offset(self, name, offset):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO merged_journals (name, offset) VALUES (?, ?)", (name, offset))
+    
+    def close(self):
+        self.conn.close()
+
+class DuplicateDetector:
+    """今回の実行分と永続インデックスの両方に対して段階的に重複を判定する"""
+    
+    def __init__(self, hash_index):
+        self.hash_index = hash_index
+        # サイズごとの今回の実行で登録済み（または抽出待ち）のファイル
+        self.seen_by_size = {}
+        # 重複判定のために読み込んだバイト数の合計
+        self.bytes_read = 0
+    
+    def find_duplicate(self, fingerprint):
+        """重複ファイルがあればその識別情報を返す（サイズが一意ならファイルは読まない）"""
+        examined = [fingerprint] + self.seen_by_size.get(fingerprint.size, [])
+        read_before = sum(entry.bytes_read for entry in examined)
+        try:
+            for candidate in examined[1:]:
+                if fingerprint.same_content(candidate):
+                    return candidate
+            for candidate in self.hash_index.candidates(fingerprint.size):
+                examined.append(candidate)
+                duplicate = fingerprint.same_content(candidate)
+                if candidate.dirty:
+                    self.hash_index.update_hashes(candidate)
+                if duplicate:
+                    return candidate
+            return None
+        finally:
+            self.bytes_read += sum(entry.bytes_read for entry in examined) - read_before
+    
+    def add(self, fingerprint):
+        self.seen_by_size.setdefault(fingerprint.size, []).append(fingerprint)
+    
+    def discard(self, fingerprint):
+        entries = self.seen_by_size.get(fingerprint.size, [])
+        if fingerprint in entries:
+            entries.remove(fingerprint)
+
+# 類似論文の判定に使うMinHash（1回のハッシュで作るone permutation hashing）の署名の長さと、
+# LSHの分割（バンド数。署名の長さ / バンド数 の値が一致するバンドが1つでもあれば候補とする）
+MINHASH_BINS = 64
+LSH_BANDS = 16
+SHINGLE_WORDS = 3
+# 1ページ目の先頭からこの単語数までをMinHashに使う
+SKETCH_MAX_WORDS = 600
+SKETCH_STRUCT = struct.Struct(f'<{MINHASH_BINS}Q')
+SKETCH_WORD_RE = re.compile(r'[^\W_]+')
+# arXivが1ページ目の余白に縦書きで付けるスタンプ（例: arXiv:2410.00907v2 [cs.CL] 2 Oct 2024）。
+# 本文中の引用と区別するため分野の括弧まで一致させる
+ARXIV_STAMP_RE = re.compile(r'arXiv:\s*(\d{4}\.\d{4,5})(v\d+)?\s*\[[A-Za-z-]+(?:\.[A-Za-z-]+)?\]')
+
+# 類似論文の判定に使う特徴（正規化したタイトルと第一著者、arXiv ID、バージョン、MinHashの署名）
+PaperFeatures = namedtuple('PaperFeatures', ['title_key', 'arxiv_id', 'arxiv_version', 'sketch'])
+# 類似論文の判定結果（関係、一致した論文のタイトル・著者・出力ファイル名、推定類似度）
+NearMatch = namedtuple('NearMatch', ['relation', 'title', 'author', 'output_filename', 'similarity'])
+
+def minhash_signature(text):
+    """テキストの単語3-gramの集合からMinHashの署名を作る（単語が少なすぎる場合はNone）"""
+    words = SKETCH_WORD_RE.findall(unicodedata.normalize('NFKC', text).lower())[:SKETCH_MAX_WORDS]
+    if len(words) < SHINGLE_WORDS + 5:
+        return None
+    bins = [None] * MINHASH_BINS
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = ' '.join(words[i:i + SHINGLE_WORDS]).encode('utf-8')
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'little')
+        index, value = value % MINHASH_BINS, value // MINHASH_BINS
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    # 空のビンは右隣のビンの値と距離で埋める（densification）
+    filled = [b for b in bins if b is not None]
+    if not filled:
+        return None
+    signature = list(bins)
+    for i in range(MINHASH_BINS):
+        distance = 1
+        while signature[i] is None:
+            neighbor = bins[(i + distance) % MINHASH_BINS]
+            if neighbor is not None:
+                signature[i] = (neighbor + distance * 0x9E3779B97F4A7C15) % (1 << 58)
+            distance += 1
+    return signature
+
+def sketch_similarity(a, b):
+    """2つのMinHashの署名から推定したJaccard係数"""
+    return sum(1 for x, y in zip(a, b) if x == y) / MINHASH_BINS
+
+def pack_sketch(sketch):
+    return SKETCH_STRUCT.pack(*sketch) if sketch else None
+
+def unpack_sketch(data):
+    return list(SKETCH_STRUCT.unpack(data)) if data else None
+
+def lsh_buckets(sketch):
+    """署名をバンドに分け、(バンド番号, バケット) のリストを返す"""
+    data = SKETCH_STRUCT.pack(*sketch)
+    width = len(data) // LSH_BANDS
+    # SQLiteの符号付き64ビット整数に収まるよう7バイトにする
+    return [(band, int.from_bytes(hashlib.blake2b(data[band * width:(band + 1) * width], digest_size=7).digest(),
+                                  'little'))
+            for band in range(LSH_BANDS)]
+
+def title_key(title, author):
+    """表記ゆれを除いたタイトルと第一著者の姓（どちらかが不十分ならNone）"""
+    if not title or not author or author == "Unknown":
+        return None
+    words = SKETCH_WORD_RE.findall(unicodedata.normalize('NFKC', title).lower())
+    surname = SKETCH_WORD_RE.findall(unicodedata.normalize('NFKC', author).lower())
+    if sum(len(word) for word in words) < 15 or not surname:
+        return None
+    return ' '.join(words) + '|' + surname[-1]
+
+def find_arxiv_id(pdf_path, text=""):
+    """ファイル名または1ページ目のarXivのスタンプからarXiv ID（バージョン付き）を探す
+    
+    arXivからダウンロードしたファイル名を優先し、なければテキスト抽出で末尾に来るスタンプ（最後の一致）を使う
+    """
+    match = ARXIV_ID_RE.search(os.path.basename(pdf_path))
+    if match is None:
+        stamps = list(ARXIV_STAMP_RE.finditer(text))
+        match = stamps[-1] if stamps else None
+    return match.group(1) + (match.group(2) or '') if match else None
+
+def paper_features(info):
+    """抽出結果から類似論文の判定に使う特徴を作る"""
+    method = info.get('method') or ''
+    # ファイル名をタイトルとした結果は同じ論文かどうかの判断に使えない
+    key = None if 'title:filename' in method or method.endswith(('error', 'no_text')) else title_key(info['title'], info['author'])
+    arxiv_id, arxiv_version = info.get('arxiv_id'), None
+    if arxiv_id:
+        match = ARXIV_ID_RE.search(arxiv_id)
+        arxiv_id, arxiv_version = match.group(1), int(match.group(2)[1:]) if match.group(2) else None
+    return PaperFeatures(key, arxiv_id, arxiv_version, info.get('sketch'))
+
+class NearDuplicateDetector:
+    """バージョン違いや再ダウンロードなど、内容が完全には一致しない同じ論文を判定する
+    
+    正規化したタイトルと第一著者、arXiv IDは完全一致で、1ページ目のテキストはMinHashのLSHで候補を絞り込むため、
+    登録済みの論文の数によらず一定の回数の検索で判定できる。今回の実行分はメモリ上の索引でも判定する
+    """
+    
+    def __init__(self, hash_index, threshold=0.7):
+        self.hash_index = hash_index
+        self.threshold = threshold
+        # 今回の実行で登録済み（または配置待ち）の論文（キー → PDFのパスのリスト）
+        self.pending = {}
+        self.by_key = {}
+    
+    def _keys(self, features):
+        keys = []
+        if features.title_key:
+            keys.append(('title', features.title_key))
+        if features.arxiv_id:
+            keys.append(('arxiv', features.arxiv_id))
+        if features.sketch:
+            keys.extend(('band',) + bucket for bucket in lsh_buckets(features.sketch))
+        return keys
+    
+    def find(self, features):
+        """一致する論文があれば NearMatch を返す（arXiv IDとバージョン、arXiv IDが一致するものを優先し、次に類似度の高いもの）"""
+        candidates = list(self.hash_index.find_papers(features))
+        for key in self._keys(features):
+            for pdf_path in self.by_key.get(key, ()):
+                candidates.append(self.pending[pdf_path])
+        best = None
+        for title, author, output_filename, other in candidates:
+            similarity = sketch_similarity(features.sketch, other.sketch) if features.sketch and other.sketch else None
+            if features.arxiv_id and features.arxiv_id == other.arxiv_id:
+                # 同じバージョンが登録済みならそれを優先し（再ダウンロード）、なければ最新のバージョンと比べる
+                if features.arxiv_version and features.arxiv_version == other.arxiv_version:
+                    rank = (3, similarity or 0)
+                else:
+                    rank = (2, other.arxiv_version or 0)
+            elif features.title_key and features.title_key == other.title_key:
+                rank = (1, similarity or 0)
+            elif similarity is not None and similarity >= self.threshold:
+                rank = (0, similarity)
+            else:
+                continue
+            if best is None or rank > best[0]:
+                best = (rank, title, author, output_filename, other, similarity)
+        if best is None:
+            return None
+        _, title, author, output_filename, other, similarity = best
+        relation = 'duplicate'
+        if features.arxiv_id and features.arxiv_id == other.arxiv_id and features.arxiv_version and other.arxiv_version:
+            if features.arxiv_version > other.arxiv_version:
+                relation = 'newer_version'
+            elif features.arxiv_version < other.arxiv_version:
+                relation = 'older_version'
+        return NearMatch(relation, title, author, output_filename, similarity)
+    
+    def add(self, pdf_path, features, title, author):
+        self.pending[pdf_path] = (title, author, None, features)
+        for key in self._keys(features):
+            self.by_key.setdefault(key, []).append(pdf_path)
+    
+    def discard(self, pdf_path):
+        entry = self.pending.pop(pdf_path, None)
+        if entry is None:
+            return
+        for key in self._keys(entry[3]):
+            paths = self.by_key.get(key, [])
+            if pdf_path in paths:
+                paths.remove(pdf_path)
+
+class ExtractionCache:
+    """コンテンツハッシュと抽出器バージョンをキーにした抽出結果のキャッシュ（件数上限付きLRU）
+    
+    検索はサイズ→部分ハッシュ→全体ハッシュの順に行い、一致する候補がある場合だけファイル全体を読む
+    """
+    
+    # 何件追加するごとに上限を超えた古いエントリを削除するか
+    EVICT_INTERVAL = 100
+    
+    def __init__(self, db_path, max_entries, options=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        # 抽出エンジンと2ページ目の扱いによって結果が異なるため、既定以外の設定はキーに付ける
+        options = options or {}
+        variant = []
+        if options.get('engine', 'text') != 'text':
+            variant.append(options['engine'])
+        if not options.get('incremental', True):
+            variant.append('all_pages')
+        self.key_prefix = ','.join(variant) + ':' if variant else ''
+        self.puts = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " hash TEXT PRIMARY KEY,"
+                " size INTEGER,"
+                " quick_hash TEXT,"
+                " version INTEGER NOT NULL,"
+                " title TEXT,"
+                " subtitle TEXT,"
+                " author TEXT,"
+                " method TEXT,"
+                " last_used REAL,"
+                " arxiv_id TEXT,"
+                " sketch BLOB)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS extraction_cache_last_used ON extraction_cache (last_used)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS extraction_cache_size ON extraction_cache (size, quick_hash)")
+            # 抽出器のバージョンが変わったエントリは無効
+            self.conn.execute("DELETE FROM extraction_cache WHERE version != ?", (EXTRACTOR_VERSION,))
+        self._evict()
+    
+    def size_hints(self):
+        """キャッシュ済みの (サイズ, 部分ハッシュ) を返す"""
+        return self.conn.execute("SELECT DISTINCT size, quick_hash FROM extraction_cache").fetchall()
+    
+    def lookup(self, fingerprint):
+        """ファイルのキャッシュされた抽出結果を返す（なければNone）
+        
+        同じサイズと部分ハッシュのエントリがある場合だけ全体ハッシュを計算するため、
+        キャッシュにないファイルは重複判定で読んだ分以上には読み込まない
+        """
+        if self.conn.execute("SELECT 1 FROM extraction_cache WHERE size = ? LIMIT 1",
+                             (fingerprint.size,)).fetchone() is None:
+            return None
+        quick_hash = fingerprint.quick_hash()
+        if quick_hash is None or self.conn.execute(
+                "SELECT 1 FROM extraction_cache WHERE size = ? AND quick_hash = ? LIMIT 1",
+                (fingerprint.size, quick_hash)).fetchone() is None:
+            return None
+        full_hash = fingerprint.full_hash()
+        return self.get(full_hash) if full_hash else None
+    
+    def get(self, file_hash):
+        """キャッシュされた抽出結果を返す（なければNone）"""
+        file_hash = self.key_prefix + file_hash
+        row = self.conn.execute(
+            "SELECT title, subtitle, author, method, arxiv_id, sketch FROM extraction_cache WHERE hash = ? AND version = ?",
+            (file_hash, EXTRACTOR_VERSION)
+        ).fetchone()
+        if row is None:
+            return None
+        # 最終利用時刻の更新は次のputかcloseでまとめてコミットする
+        self.conn.execute("UPDATE extraction_cache SET last_used = ? WHERE hash = ?", (time.time(), file_hash))
+        info = dict(zip(('title', 'subtitle', 'author', 'method', 'arxiv_id'), row))
+        info['sketch'] = unpack_sketch(row[5])
+        return info
+    
+    def put(self, fingerprint, info):
+        """抽出結果を登録する（全体ハッシュと部分ハッシュが分かっているファイルのみ）"""
+        if not fingerprint.known_full_hash() or not fingerprint.known_quick_hash():
+            return
+        file_hash = self.key_prefix + fingerprint.known_full_hash()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache"
+                " (hash, size, quick_hash, version, title, subtitle, author, method, last_used, arxiv_id, sketch)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, fingerprint.size, fingerprint.known_quick_hash(), EXTRACTOR_VERSION, info['title'], info.get('subtitle'),
+                 info['author'], info.get('method'), time.time(), info.get('arxiv_id'),
+                 pack_sketch(info.get('sketch')))
+            )
+        self.puts += 1
+        if self.puts % self.EVICT_INTERVAL == 0:
+            self._evict()
+    
+    def _evict(self):
+        """上限を超えた分を最終利用時刻の古い順に削除する"""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM extraction_cache WHERE hash IN ("
+                " SELECT hash FROM extraction_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+    
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class ScanSnapshot:
+    """入力フォルダの走査結果（フォルダのmtimeと、スキップしたファイルの (サイズ, mtime, iノード)）のSQLiteスナップショット
+    
+    前回から変更のないフォルダは読み込まずに記録済みのサブフォルダだけを確認し、
+    記録と同じ状態のファイルはハッシュを計算せずにスキップする。変更内容は close() でまとめて保存する
+    """
+    
+    SCHEMA_VERSION = 1
+    # 走査開始の直前に更新されたフォルダは、同じmtimeのまま再び更新される可能性があるため変更なしとして記録しない
+    RACY_WINDOW_NS = 2 * 10 ** 9
+    
+    def __init__(self, db_path, settings, reset=False):
+        self.db_path = db_path
+        self.started_ns = time.time_ns()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                for table in ('scan_dirs', 'scan_files', 'scan_meta'):
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_dirs ("
+                " path TEXT PRIMARY KEY,"
+                " parent TEXT,"
+                " mtime_ns INTEGER NOT NULL,"
+                " clean INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scan_files ("
+                " path TEXT PRIMARY KEY,"
+                " dir TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " inode INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS scan_files_dir ON scan_files (dir)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS scan_meta (key TEXT PRIMARY KEY, value TEXT)")
+            # 入力フォルダや除外設定が変わった場合は前回の走査結果を使わない
+            settings_key = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+            row = self.conn.execute("SELECT value FROM scan_meta WHERE key = 'settings'").fetchone()
+            if reset or row is None or row[0] != settings_key:
+                self.conn.execute("DELETE FROM scan_dirs")
+                self.conn.execute("DELETE FROM scan_files")
+                self.conn.execute("INSERT OR REPLACE INTO scan_meta (key, value) VALUES ('settings', ?)", (settings_key,))
+        
+        self.dirs = {}
+        self.children = {}
+        for path, parent, mtime_ns, clean in self.conn.execute("SELECT path, parent, mtime_ns, clean FROM scan_dirs"):
+            self.dirs[path] = (mtime_ns, bool(clean))
+            self.children.setdefault(parent, []).append(path)
+        # 今回の走査で読み込んだフォルダと、重複としてスキップされたファイル（closeで保存する）
+        self._scanned = {}
+        self._trusted = []
+        self.skipped_dirs = 0
+        self.skipped_files = 0
+    
+    def unchanged(self, dir_path, mtime_ns):
+        """前回の走査から変更がなく、未処理のファイルも残っていないフォルダかどうか"""
+        return self.dirs.get(dir_path) == (mtime_ns, True)
+    
+    def subdirs(self, dir_path):
+        """前回の走査で記録したサブフォルダ"""
+        return self.children.get(dir_path, [])
+    
+    def files(self, dir_path):
+        """フォルダ内の記録済みファイルの {パス: (サイズ, mtime, iノード)}"""
+        return {path: (size, mtime_ns, inode) for path, size, mtime_ns, inode in self.conn.execute(
+            "SELECT path, size, mtime_ns, inode FROM scan_files WHERE dir = ?", (dir_path,))}
+    
+    def record_dir(self, dir_path, parent, mtime_ns, pending, subdirs, kept_files):
+        """読み込んだフォルダの状態を記録する（pendingは処理対象として返したファイルがあるかどうか）"""
+        clean = not pending and mtime_ns < self.started_ns - self.RACY_WINDOW_NS
+        self._scanned[dir_path] = (parent, mtime_ns, clean, set(subdirs), kept_files)
+    
+    def trust(self, path, stat_key):
+        """重複としてスキップしたファイルを、次回以降ハッシュを計算せずにスキップできるよう記録する"""
+        if stat_key:
+            self._trusted.append((path, os.path.dirname(path)) + tuple(stat_key))
+    
+    def _delete_tree(self, dir_path):
+        """フォルダとその下のフォルダ・ファイルの記録を削除する"""
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        upper = prefix[:-1] + chr(ord(os.sep) + 1)
+        self.conn.execute("DELETE FROM scan_dirs WHERE path = ? OR (path >= ? AND path < ?)", (dir_path, prefix, upper))
+        self.conn.execute("DELETE FROM scan_files WHERE dir = ? OR (dir >= ? AND dir < ?)", (dir_path, prefix, upper))
+    
+    def close(self):
+        with self.conn:
+            for dir_path, (parent, mtime_ns, clean, subdirs, kept_files) in self._scanned.items():
+                # なくなったサブフォルダの記録を削除する
+                for child in self.children.get(dir_path, []):
+                    if child not in subdirs:
+                        self._delete_tree(child)
+                self.conn.execute("DELETE FROM scan_files WHERE dir = ?", (dir_path,))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO scan_files (path, dir, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+                    [(path, dir_path) + tuple(key) for path, key in kept_files]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO scan_dirs (path, parent, mtime_ns, clean) VALUES (?, ?, ?, ?)",
+                    (dir_path, parent, mtime_ns, int(clean))
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scan_files (path, dir, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+                self._trusted
+            )
+        self.conn.close()
+
+class ClusterCoordinator:
+    """共有フォルダ上のロックファイルで、複数のノードが同じファイルを二重に処理しないよう調整する
+    
+    ファイルはまず入力フォルダからの相対パスで、重複判定の前に内容（サイズと部分ハッシュ）でロックする。
+    ロックはlease_seconds以上更新されなければ期限切れとみなし、他のノードが引き継ぐ。
+    保持中のロックはバックグラウンドのスレッドがlease_secondsの1/3ごとに更新する。
+    各ノードは処理結果を自分のジャーナルに追記し、起動時に他のノードのジャーナルをインデックスに取り込む
+    """
+    
+    def __init__(self, cluster_dir, node_id, input_folders, lease_seconds=900, shard_index=0, shard_count=1):
+        self.cluster_dir = cluster_dir
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.shard_index = shard_index
+        self.shard_count = max(1, shard_count)
+        self.roots = [os.path.normcase(os.path.abspath(folder)) for folder in input_folders]
+        self.lock_dir = os.path.join(cluster_dir, 'locks')
+        self.journal_dir = os.path.join(cluster_dir, 'journals')
+        os.makedirs(self.lock_dir, exist_ok=True)
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # ノード内で一意なロックの所有者（期限切れで他のノードに引き継がれたロックを削除しないため）
+        self.token = f"{node_id}:{os.getpid()}:{time.time_ns()}"
+        # PDFのパス → 保持しているロックファイルのパス
+        self.held = {}
+        self._lock = threading.Lock()
+        self.journal_path = os.path.join(self.journal_dir, f"{node_id}.jsonl")
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.busy_elsewhere = 0
+        # 処理に時間がかかっても期限切れにならないよう、保持中のロックのmtimeを定期的に更新する
+        self._stop_renewal = threading.Event()
+        self._renewal = threading.Thread(target=self._renew_loop, name='cluster-lease', daemon=True)
+        self._renewal.start()
+    
+    def _read_token(self, lock_path):
+        try:
+            with open(lock_path, 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _renew_loop(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop_renewal.wait(interval):
+            self.renew()
+    
+    def renew(self):
+        """保持中のロックのmtimeを更新する（他のノードに引き継がれたロックは更新しない）"""
+        with self._lock:
+            lock_paths = [lock_path for paths in self.held.values() for lock_path in paths]
+        for lock_path in lock_paths:
+            if self._read_token(lock_path) != self.token:
+                continue
+            try:
+                os.utime(lock_path)
+            except OSError:
+                pass
+    
+    def holds(self, pdf_path):
+        """PDFについて取得したロックをすべて保持し続けているか（期限切れで引き継がれていればFalse）"""
+        with self._lock:
+            lock_paths = list(self.held.get(pdf_path, ()))
+        return all(self._read_token(lock_path) == self.token for lock_path in lock_paths)
+    
+    def path_key(self, pdf_path):
+        """入力フォルダからの相対パス（ノードごとにマウント先が異なっても同じになる）のハッシュ"""
+        path = os.path.normcase(os.path.abspath(pdf_path))
+        for root in self.roots:
+            if path.startswith(root.rstrip(os.sep) + os.sep):
+                path = os.path.relpath(path, root)
+                break
+        return hashlib.sha1(path.replace(os.sep, '/').encode('utf-8')).hexdigest()
+    
+    def _acquire(self, lock_path):
+        """ロックファイルを排他的に作成する（期限切れのロックは1回だけ奪って再試行する）"""
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                try:
+                    st = os.stat(lock_path)
+                except FileNotFoundError:
+                    continue
+                if time.time() - st.st_mtime <= self.lease_seconds:
+                    return False
+                # 期限切れのロックは別名に移してから削除する（renameは1つのノードだけが成功する）
+                stale_path = f"{lock_path}.stale.{self.node_id}.{os.getpid()}"
+                try:
+                    os.rename(lock_path, stale_path)
+                except OSError:
+                    return False
+                # statしてからrenameするまでに他のノードが先に引き継いで新しいロックを作成していた場合は、
+                # 移したのは期限切れのロックではないため元に戻して諦める（linkは既存のファイルを上書きしない）
+                try:
+                    moved = os.stat(stale_path)
+                    if (moved.st_ino, moved.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+                        try:
+                            os.link(stale_path, lock_path)
+                        except FileExistsError:
+                            pass
+                        return False
+                    logger.warning(f"期限切れのロックを引き継ぎます: {lock_path}")
+                finally:
+                    try:
+                        os.remove(stale_path)
+                    except OSError:
+                        pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.token)
+            return True
+        return False
+    
+    def _claim(self, pdf_path, key):
+        lock_path = os.path.join(self.lock_dir, key + '.lock')
+        if not self._acquire(lock_path):
+            return False
+        with self._lock:
+            self.held.setdefault(pdf_path, []).append(lock_path)
+        return True
+    
+    def claim_paths(self, pdf_paths):
+        """ロックを取得できたPDFだけを返す（担当シャードのファイルを先に処理し、残りは後から引き受ける）"""
+        deferred = []
+        for pdf_path in pdf_paths:
+            key = self.path_key(pdf_path)
+            if self.shard_count > 1 and int(key[:8], 16) % self.shard_count != self.shard_index:
+                deferred.append((pdf_path, key))
+                continue
+            if self._claim_existing(pdf_path, key):
+                yield pdf_path
+        for pdf_path, key in deferred:
+            if os.path.exists(pdf_path) and self._claim_existing(pdf_path, key):
+                yield pdf_path
+    
+    def _claim_existing(self, pdf_path, key):
+        if not self._claim(pdf_path, 'p-' + key):
+            self.busy_elsewhere += 1
+            return False
+        # ロックを取得するまでの間に他のノードが処理を終えて移動した
+        if not os.path.exists(pdf_path):
+            self.release(pdf_path)
+            return False
+        return True
+    
+    def claim_content(self, pdf_path, fingerprint):
+        """同じ内容のファイルを他のノードが処理中でなければロックする"""
+        quick_hash = fingerprint.quick_hash()
+        if quick_hash is None:
+            return True
+        if self._claim(pdf_path, f"c-{fingerprint.size}-{quick_hash}"):
+            return True
+        self.busy_elsewhere += 1
+        return False
+    
+    def release(self, pdf_path):
+        """PDFについて保持しているロックを解放する"""
+        with self._lock:
+            lock_paths = self.held.pop(pdf_path, [])
+        for lock_path in lock_paths:
+            if self._read_token(lock_path) != self.token:
+                continue
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+    
+    def record(self, fingerprint, output_filename, original_path, title, author, features=None, processed_path=None):
+        """処理結果を自分のノードのジャーナルに追記する（ロックを解放する前に他のノードから読めるようにする）"""
+        entry = {'node': self.node_id, 'size': fingerprint.size, 'quick_hash': fingerprint.known_quick_hash(),
+                 'hash': fingerprint.known_full_hash(), 'output_filename': output_filename,
+                 'original_path': original_path, 'title': title, 'author': author, 'processed_at': time.time(),
+                 'processed_path': processed_path}
+        if features is not None:
+            entry['paper'] = {'title_key': features.title_key, 'arxiv_id': features.arxiv_id,
+                              'arxiv_version': features.arxiv_version,
+                              'sketch': pack_sketch(features.sketch).hex() if features.sketch else None}
+        with self._lock:
+            self.journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+    
+    def merge_journals(self, hash_index):
+        """他のノードのジャーナルのうち、前回取り込んだ位置以降の処理結果をインデックスに登録する"""
+        merged = 0
+        for name in sorted(os.listdir(self.journal_dir)):
+            path = os.path.join(self.journal_dir, name)
+            if not name.endswith('.jsonl') or path == self.journal_path:
+                continue
+            offset = hash_index.journal_offset(name)
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    # 書き込み途中の行は次回に取り込む
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    fingerprint = FileFingerprint(os.path.join(hash_index.output_folder, entry['output_filename']),
+                                                  entry['size'], entry.get('quick_hash'), entry.get('hash'))
+                    file_id = hash_index.record(fingerprint, entry['output_filename'], entry.get('original_path'),
+                                                entry.get('title'), entry.get('author'), entry.get('processed_at'),
+                                                entry.get('processed_path'))
+                    paper = entry.get('paper')
+                    if paper:
+                        sketch = unpack_sketch(bytes.fromhex(paper['sketch'])) if paper.get('sketch') else None
+                        hash_index.record_paper(file_id, PaperFeatures(paper.get('title_key'), paper.get('arxiv_id'),
+                                                                       paper.get('arxiv_version'), sketch))
+                    merged += 1
+            hash_index.set_journal_offset(name, offset)
+        if merged:
+            logger.info(f"他のノードの処理結果{merged}件をインデックスに取り込みました")
+        return merged
+    
+    def close(self):
+        self._stop_renewal.set()
+        self._renewal.join()
+        with self._lock:
+            lock_paths = list(self.held)
+        for pdf_path in lock_paths:
+            self.release(pdf_path)
+        self.journal.close()
+
+def cluster_options(config, args):
+    """設定ファイルとコマンドライン引数から複数ノードでの処理の設定を読み込む（無効ならNone）"""
+    cluster = config.get('cluster') or {}
+    if not isinstance(cluster, dict):
+        cluster = {}
+    enabled = args.cluster if args.cluster is not None else bool(cluster.get('enabled'))
+    if not enabled and not args.node_id and not args.shard:
+        return None
+    node_id = args.node_id or cluster.get('node_id') or socket.gethostname()
+    # ノードIDはロックやジャーナルのファイル名に使う
+    node_id = re.sub(r'[^A-Za-z0-9_.-]', '_', str(node_id))
+    shard = args.shard or cluster.get('shard') or '0/1'
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(shard))
+    if not match or int(match.group(2)) < 1 or int(match.group(1)) >= int(match.group(2)):
+        logger.warning(f"シャードの指定が不正なため分割しません: {shard}（例: 0/3）")
+        shard_index, shard_count = 0, 1
+    else:
+        shard_index, shard_count = int(match.group(1)), int(match.group(2))
+    return {
+        'dir': resolve_path(cluster.get('dir') or os.path.join(config['output_folder'], '.paper_rename_cluster')),
+        'node_id': node_id,
+        'lease_seconds': float(cluster.get('lease_seconds', 900) or 900),
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+    }
+
+NEAR_DUPLICATE_ACTIONS = ('flag', 'group', 'skip')
+
+def near_duplicate_options(config):
+    """設定ファイルから類似論文の判定の設定を読み込む（無効ならNone）"""
+    near = config.get('near_duplicates') or {}
+    if not isinstance(near, dict) or not near.get('enabled', True):
+        return None
+    options = {'threshold': float(near.get('threshold', 0.7) or 0.7)}
+    for key in ('on_duplicate', 'on_newer_version'):
+        action = near.get(key, 'flag') or 'flag'
+        if action not in NEAR_DUPLICATE_ACTIONS:
+            logger.warning(f"near_duplicates.{key} の値が不正なため flag を使用します: {action}")
+            action = 'flag'
+        options[key] = action
+    return options
+
+class RunReport:
+    """段階ごとの処理時間・抽出方法・入出力バイト数を集計し、実行レポート（JSON）を作成する"""
+    
+    # ヒストグラムの区間の上限（ミリ秒）
+    HISTOGRAM_BOUNDS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000, 10000]
+    
+    def __init__(self, slowest=20):
+        self.started = time.time()
+        self.slowest = slowest
+        self.stages = {}
+        self.methods = {}
+        self.bytes_read = {'hash': 0, 'extract': 0}
+        self.bytes_written = {'copy': 0, 'move': 0}
+        # 処理時間の長いファイルを上位N件だけ保持する最小ヒープ
+        self._slowest_files = []
+        self._sequence = 0
+        # ファイルごとに採用された抽出方法（記録した順）
+        self.files = []
+        # バージョン違いなどの類似論文と判定したファイル
+        self.near_duplicates = []
+        # パイプライン処理では複数のスレッドから記録される
+        self._lock = threading.RLock()
+    
+    def add_timing(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {'count': 0, 'total_sec': 0.0, 'max_sec': 0.0,
+                                          'histogram': [0] * (len(self.HISTOGRAM_BOUNDS_MS) + 1)}
+        entry['count'] += 1
+        entry['total_sec'] += seconds
+        entry['max_sec'] = max(entry['max_sec'], seconds)
+        milliseconds = seconds * 1000
+        bucket = next((i for i, bound in enumerate(self.HISTOGRAM_BOUNDS_MS) if milliseconds < bound),
+                      len(self.HISTOGRAM_BOUNDS_MS))
+        entry['histogram'][bucket] += 1
+    
+    def add_bytes_read(self, kind, count):
+        with self._lock:
+            self.bytes_read[kind] = self.bytes_read.get(kind, 0) + count
+    
+    def add_bytes_written(self, kind, count):
+        with self._lock:
+            self.bytes_written[kind] = self.bytes_written.get(kind, 0) + count
+    
+    def add_file(self, pdf_path, timings, method):
+        """1ファイル分の段階別処理時間と採用された抽出方法を記録する"""
+        with self._lock:
+            self._add_file(pdf_path, timings, method)
+    
+    def _add_file(self, pdf_path, timings, method):
+        for stage, seconds in timings.items():
+            self.add_timing(stage, seconds)
+        self.methods[method] = self.methods.get(method, 0) + 1
+        self.files.append({'path': pdf_path, 'method': method})
+        if self.slowest <= 0:
+            return
+        total = sum(timings.values())
+        self._sequence += 1
+        item = (total, self._sequence, pdf_path, method, dict(timings))
+        if len(self._slowest_files) < self.slowest:
+            heapq.heappush(self._slowest_files, item)
+        elif total > self._slowest_files[0][0]:
+            heapq.heapreplace(self._slowest_files, item)
+    
+    def add_near_duplicate(self, pdf_path, match, action):
+        with self._lock:
+            self.near_duplicates.append({
+                'path': pdf_path, 'relation': match.relation, 'action': action,
+                'existing': match.output_filename or build_new_filename(match.title, match.author),
+                'similarity': round(match.similarity, 3) if match.similarity is not None else None,
+            })
+    
+    def to_dict(self, stats):
+        elapsed = time.time() - self.started
+        labels = [f"<{bound}ms" for bound in self.HISTOGRAM_BOUNDS_MS]
+        labels.append(f">={self.HISTOGRAM_BOUNDS_MS[-1]}ms")
+        stages = {}
+        for stage, entry in self.stages.items():
+            stages[stage] = {
+                'count': entry['count'],
+                'total_sec': round(entry['total_sec'], 6),
+                'mean_ms': round(entry['total_sec'] / entry['count'] * 1000, 3) if entry['count'] else 0.0,
+                'max_ms': round(entry['max_sec'] * 1000, 3),
+                'histogram': dict(zip(labels, entry['histogram'])),
             }
-            with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(sample_config, f, default_flow_style=False, allow_unicode=True)
-            logger.info(f"サンプル設定ファイルを作成しました: {config_path}")
+        slowest_files = [
+            {'path': path, 'total_sec': round(total, 6), 'method': method,
+             'stages': {stage: round(seconds, 6) for stage, seconds in timings.items()}}
+            for total, _, path, method, timings in sorted(self._slowest_files, reverse=True)
+        ]
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'elapsed_sec': round(elapsed, 3),
+            'files_per_sec': round(stats.get('total', 0) / elapsed, 3) if elapsed > 0 else 0.0,
+            'stats': stats,
+            'stages': stages,
+            'methods': self.methods,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'slowest_files': slowest_files,
+            'files': self.files,
+            'near_duplicates': self.near_duplicates,
+        }
+    
+    def write(self, path, stats):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(stats), f, ensure_ascii=False, indent=2)
+        logger.info(f"実行レポートを出力しました: {path}")
+
+# 抽出処理が上限を超えたファイルの扱い（budget.on_exceed）
+BUDGET_ACTIONS = ('fallback', 'quarantine')
+
+# 抽出処理のプロファイル（プロセスごとに1つ。profile_dirを指定した場合のみ使用）
+_profiler = None
+# _profilerを作成したプロセス（forkで引き継いだプロファイルは使わない）
+_profiler_pid = None
+
+def run_extractor(pdf_path, options, profile_dir=None):
+    """抽出処理を実行する（profile_dirを指定するとcProfileの結果をプロセスの終了時に保存する）"""
+    global _profiler, _profiler_pid
+    if not profile_dir:
+        return extract_paper_info(pdf_path, **options)
+    if _profiler is None or _profiler_pid != os.getpid():
+        _profiler = cProfile.Profile()
+        _profiler_pid = os.getpid()
+        # ファイルごとではなく終了時に1回だけ書き出す（atexitはプロセスプールのワーカーでは実行されないためFinalizeを使う）
+        multiprocessing.util.Finalize(None, _profiler.dump_stats,
+                                      args=(os.path.join(profile_dir, f"extract_{_profiler_pid}.prof"),),
+                                      exitpriority=10)
+    _profiler.enable()
+    try:
+        return extract_paper_info(pdf_path, **options)
+    finally:
+        _profiler.disable()
+
+def _extract_worker(pdf_path, options, profile_dir=None):
+    """プロセスプール内で実行される抽出処理（結果をパスと組にして返す）"""
+    return pdf_path, run_extractor(pdf_path, options, profile_dir)
+
+def iter_extracted_parallel(items, workers, options=None, profile_dir=None, sandbox=None, executor=None):
+    """プロセスプールで抽出処理を並列実行し、完了順に (パス, 抽出結果) を返す
+    
+    itemsは (パス, キャッシュ済みの抽出結果またはNone) の組で、キャッシュ済みのものはそのまま返す。
+    sandbox（ExtractionSandbox）を指定すると、プロセスプールの代わりにその隔離されたワーカーで実行する。
+    executorを渡すとそれを使い、終了時にシャットダウンしない（監視モードでワーカーを使い回すため）
+    """
+    if executor is None:
+        executor_class = ThreadPoolExecutor if sandbox is not None else ProcessPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            yield from iter_extracted_parallel(items, workers, options, profile_dir, sandbox, executor)
+        return
+    # 大量のファイルでもメモリを圧迫しないよう、実行中のタスク数を制限する
+    max_in_flight = workers * 4
+    pending = set()
+    for pdf_path, cached in items:
+        if cached is not None:
+            yield pdf_path, cached
+            continue
+        if sandbox is not None:
+            pending.add(executor.submit(_sandbox_task, sandbox, pdf_path, options or {}))
+        else:
+            pending.add(executor.submit(_extract_worker, pdf_path, options or {}, profile_dir))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in as_completed(pending):
+        yield future.result()
+
+def process_rss(pid):
+    """プロセスの常駐メモリ量（バイト）を返す（/procを読めない環境ではNone）"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def budget_exceeded_info(pdf_path, reason, elapsed):
+    """上限を超えて中断したファイルの抽出結果（ファイル名をタイトルとして使う）"""
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return {'title': base_name, 'subtitle': None, 'author': "Unknown", 'method': f"budget:{reason}",
+            'budget_exceeded': reason, 'timings': {'extract_budget': elapsed}}
+
+def _sandbox_worker(conn, profile_dir):
+    """隔離されたワーカープロセスで抽出処理を繰り返し実行する"""
+    # 起動が完了したことを知らせる（起動にかかる時間は制限時間に含めない）
+    conn.send(os.getpid())
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
             return
+        if task is None:
+            return
+        pdf_path, options = task
+        conn.send(run_extractor(pdf_path, options, profile_dir))
+
+class ExtractionSandbox:
+    """処理時間とメモリ使用量の上限を超えた抽出処理を強制終了できる、隔離されたワーカープロセスのプール
+    
+    extract() は複数のスレッドから同時に呼び出せる。上限を超えたワーカーは強制終了し、次に必要になったときに作り直す
+    """
+    
+    # 実行中のワーカーの経過時間とメモリ使用量を確認する間隔（秒）
+    CHECK_INTERVAL = 0.05
+    # ワーカーの起動を待つ最大時間（秒）
+    START_TIMEOUT = 60
+    REASONS = {'timeout': "制限時間", 'memory': "メモリ上限", 'crashed': "ワーカーの異常終了"}
+    
+    def __init__(self, workers=1, timeout=None, max_rss=None, max_tasks=100, profile_dir=None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.max_tasks = max_tasks
+        self.profile_dir = profile_dir
+        # スレッドを使う処理（パイプラインなど）からforkしないよう、可能ならforkserverを使う
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._count = 0
+    
+    def _spawn(self):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_sandbox_worker, args=(child_conn, self.profile_dir), daemon=True)
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(self.START_TIMEOUT):
+                raise OSError(errno.ETIMEDOUT, "抽出ワーカーが起動しませんでした")
+            parent_conn.recv()
+        except (EOFError, OSError):
+            process.kill()
+            process.join()
+            parent_conn.close()
+            raise
+        return {'process': process, 'conn': parent_conn, 'tasks': 0}
+    
+    def _acquire(self):
+        """空いているワーカーを取得する（上限数に達していなければ新しく起動する）"""
+        with self._lock:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            spawn = self._count < self.workers
+            if spawn:
+                self._count += 1
+        if not spawn:
+            return self._idle.get()
+        try:
+            return self._spawn()
+        except Exception:
+            with self._lock:
+                self._count -= 1
+            raise
+    
+    def _release(self, worker):
+        # 一定件数を処理したワーカーはメモリの断片化を避けるため作り直す
+        if self.max_tasks and worker['tasks'] >= self.max_tasks:
+            self._stop(worker)
+        else:
+            self._idle.put(worker)
+    
+    def _stop(self, worker, kill=False):
+        process, conn = worker['process'], worker['conn']
+        if not kill:
+            try:
+                conn.send(None)
+            except OSError:
+                kill = True
+            process.join(1)
+        if kill or process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+        with self._lock:
+            self._count -= 1
+    
+    def extract(self, pdf_path, options):
+        """ワーカープロセスで抽出処理を実行し、上限を超えた場合はファイル名による抽出結果を返す"""
+        worker = self._acquire()
+        worker['tasks'] += 1
+        conn, process = worker['conn'], worker['process']
+        started = time.monotonic()
+        reason = None
+        try:
+            conn.send((pdf_path, options))
+            while not conn.poll(self.CHECK_INTERVAL):
+                if not process.is_alive():
+                    reason = 'crashed'
+                elif self.timeout and time.monotonic() - started > self.timeout:
+                    reason = 'timeout'
+                elif self.max_rss and (process_rss(process.pid) or 0) > self.max_rss:
+                    reason = 'memory'
+                if reason:
+                    break
+            else:
+                result = conn.recv()
+        except (EOFError, OSError):
+            reason = 'crashed'
         
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        if reason is None:
+            self._release(worker)
+            return result
+        self._stop(worker, kill=True)
+        elapsed = time.monotonic() - started
+        logger.warning(f"抽出処理が{self.REASONS[reason]}を超えたため中断しました（{elapsed:.1f}秒）: {pdf_path}")
+        return budget_exceeded_info(pdf_path, reason, elapsed)
+    
+    def close(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._stop(worker)
+
+def _sandbox_task(sandbox, pdf_path, options):
+    """スレッドプール内で実行される隔離された抽出処理（結果をパスと組にして返す）"""
+    return pdf_path, sandbox.extract(pdf_path, options)
+
+def extractor_options(config):
+    """設定ファイルから extract_paper_info() に渡すオプションを作成する"""
+    return {
+        # 2ページ目は1ページ目で抽出できなかった場合のみ解析する
+        'incremental': bool(config.get('incremental_pages', True)),
+        # メタデータだけで十分な場合はページを解析しない
+        'metadata_fast_path': bool(config.get('metadata_fast_path', True)),
+        # text: PyPDF2のextract_text() / fontscan: 1ページ目をフォントサイズ付きで走査
+        'engine': extraction_engine(config),
+    }
+
+def extraction_engine(config):
+    """設定ファイルから抽出エンジンを読み込む"""
+    engine = config.get('extraction_engine', 'text') or 'text'
+    if engine not in EXTRACTION_ENGINES:
+        logger.warning(f"不明な抽出エンジンのためtextを使用します: {engine}")
+        engine = 'text'
+    return engine
+
+class Ingester:
+    """重複チェック・抽出結果の集計・コピーと移動・インデックス登録の各段階をまとめたもの
+    
+    逐次処理と非同期パイプラインの両方から使う。SQLiteを使う段階（screen / record_extraction / commit）は
+    同じスレッドから呼び出すこと
+    """
+    
+    def __init__(self, config, stats, hash_index, cache=None, report=None, snapshot=None, sandbox=None,
+                 manifest=None, coordinator=None):
+        self.output_folder = config['output_folder']
+        self.processed_folder = config['processed_folder']
+        self.stats = stats
+        self.hash_index = hash_index
+        self.cache = cache
+        self.snapshot = snapshot
+        self.sandbox = sandbox
+        # planフェーズではコピー・移動を行わず、マニフェストに書き出す
+        self.manifest = manifest
+        # 複数ノードで処理する場合は、ロックを取得できたファイルだけを処理する
+        self.coordinator = coordinator
+        self.report = report if report is not None else RunReport()
+        self.placement = config.get('placement', 'auto')
+        if self.placement not in PLACEMENT_STRATEGIES:
+            logger.warning(f"不明な配置方法のためautoを使用します: {self.placement}")
+            self.placement = 'auto'
+        # 出力フォルダと処理済みフォルダのファイル名は最初に1回だけ走査する
+        self.output_names = NameIndex(self.output_folder)
+        self.processed_names = NameIndex(self.processed_folder)
+        # 処理済み（または抽出待ち）ファイルの識別情報を記録
+        self.detector = DuplicateDetector(hash_index)
+        # 抽出処理が上限を超えたファイルの扱い（fallback: ファイル名で配置 / quarantine: 隔離フォルダへ移動）
+        budget = config.get('budget') or {}
+        self.on_budget_exceeded = budget.get('on_exceed', 'fallback') if isinstance(budget, dict) else 'fallback'
+        self.quarantine_names = None
+        if self.on_budget_exceeded == 'quarantine':
+            self.quarantine_folder = config['quarantine_folder']
+            os.makedirs(self.quarantine_folder, exist_ok=True)
+            self.quarantine_names = NameIndex(self.quarantine_folder)
+        # バージョン違いなどの類似論文の扱い（skip: 入力フォルダに残す / group: 一致した論文と同じ名前に
+        # バージョンなどを付けて配置 / flag: 通常どおり配置して警告とレポートに記録）
+        near = near_duplicate_options(config)
+        self.near_detector = NearDuplicateDetector(hash_index, near['threshold']) if near else None
+        self.near_actions = near
+        # パイプラインのハッシュ段階で使う、登録済みのサイズ → 部分ハッシュの集合（load_hash_hints() で読み込む）と
+        # ハッシュ段階を通過した今回の実行分のサイズ → 識別情報のリスト
+        self.hash_hints = None
+        self.hashed_by_size = {}
+        self._hashed_lock = threading.Lock()
+    
+    def load_hash_hints(self):
+        """インデックスとキャッシュに登録済みの (サイズ, 部分ハッシュ) を読み込む（SQLiteのスレッドで呼び出す）"""
+        hints = {}
+        sources = [self.hash_index] + ([self.cache] if self.cache is not None else [])
+        for source in sources:
+            for size, quick_hash in source.size_hints():
+                hints.setdefault(size, set()).add(quick_hash)
+        self.hash_hints = hints
+    
+    def prefetch_hashes(self, fingerprint):
+        """重複判定とキャッシュの検索で必要になるハッシュを先に計算し、読み込んだバイト数を返す
         
-        # 複数の入力フォルダに対応
-        input_folders = config.get('input_folders', [])
-        # 後方互換性のため、古い形式のinput_folderもサポート
-        if not input_folders and 'input_folder' in config:
-            input_folders = [config.get('input_folder')]
-            
-        output_folder = config.get('output_folder', './outputs')
-        processed_folder = config.get('processed_folder', './processed_papers')
+        SQLiteを使わないため任意のスレッドから呼べる。同じサイズのファイルがなければ読み込まず、
+        部分ハッシュも一致する可能性がある場合だけ全体ハッシュを計算する。
+        今回の実行で先にハッシュ段階を通過した同じサイズのファイル（比較相手）のハッシュもここで計算しておく
+        """
+        with self._hashed_lock:
+            others = self.hashed_by_size.setdefault(fingerprint.size, [])
+            others, _ = list(others), others.append(fingerprint)
+        quick_hashes = (self.hash_hints or {}).get(fingerprint.size) or set()
+        if not quick_hashes and not others:
+            return 0
+        read_before = sum(entry.bytes_read for entry in others)
+        quick_hash = fingerprint.quick_hash()
+        if quick_hash is None:
+            return fingerprint.bytes_read
+        matched = quick_hash in quick_hashes or None in quick_hashes
+        for other in others:
+            if other.quick_hash() == quick_hash:
+                other.full_hash()
+                matched = True
+        if matched:
+            fingerprint.full_hash()
+        return fingerprint.bytes_read + sum(entry.bytes_read for entry in others) - read_before
+    
+    def claim_paths(self, pdf_paths):
+        """他のノードが処理中のファイルを除外する（単独で実行する場合はそのまま返す）"""
+        if self.coordinator is None:
+            return pdf_paths
+        return self.coordinator.claim_paths(pdf_paths)
+    
+    def screen(self, pdf_path):
+        """重複を判定し、処理対象なら (識別情報, キャッシュ済みの抽出結果またはNone, 段階別処理時間) を返す"""
+        timings = {}
+        with timed(timings, 'hash'):
+            fingerprint = FileFingerprint.from_path(pdf_path)
+        return self.screen_fingerprint(pdf_path, fingerprint, timings)
+    
+    def screen_fingerprint(self, pdf_path, fingerprint, timings):
+        """FileFingerprint.from_path() 済みのファイルについて screen() と同じ判定を行う"""
+        stats, report, cache = self.stats, self.report, self.cache
+        stats['total'] += 1
+        
+        # サイズ→部分ハッシュ→全体ハッシュの順に必要な分だけ読んで重複を判定
+        read_before = self.detector.bytes_read
+        with timed(timings, 'hash'):
+            duplicate = self.detector.find_duplicate(fingerprint) if fingerprint else None
+            if not duplicate and fingerprint and self.coordinator is not None:
+                if not self.coordinator.claim_content(pdf_path, fingerprint):
+                    report.add_bytes_read('hash', self.detector.bytes_read - read_before)
+                    logger.info(f"他のノードが同じ内容のファイルを処理中のためスキップします: {pdf_path}")
+                    report.add_file(pdf_path, timings, 'claimed')
+                    stats['skipped'] += 1
+                    self.coordinator.release(pdf_path)
+                    return None
+                # ロックを取得するまでに他のノードが処理を終えていれば、その結果で重複を判定する
+                if self.coordinator.merge_journals(self.hash_index):
+                    duplicate = self.detector.find_duplicate(fingerprint)
+        report.add_bytes_read('hash', self.detector.bytes_read - read_before)
+        if duplicate:
+            report.add_file(pdf_path, timings, 'indexed' if duplicate.row_id is not None else 'duplicate')
+            if duplicate.row_id is not None:
+                # 過去の実行で処理済みのファイルはPDFを解析せずにスキップ
+                logger.info(f"処理済みファイルのためスキップします: {pdf_path} (出力: {os.path.basename(duplicate.path)})")
+            else:
+                logger.info(f"重複ファイルのためスキップします: {pdf_path}")
+            stats['skipped'] += 1
+            # 入力フォルダに残る重複ファイルは、変更がなければ次回の走査でハッシュを計算せずにスキップする
+            if self.snapshot is not None:
+                self.snapshot.trust(pdf_path, fingerprint.stat_key)
+            if self.coordinator is not None:
+                self.coordinator.release(pdf_path)
+            return None
+        
+        # 並列実行中に同じ内容のファイルが二重に抽出されないよう先に登録する
+        if fingerprint:
+            self.detector.add(fingerprint)
+            if self.hash_hints is not None:
+                self.hash_hints.setdefault(fingerprint.size, set()).add(fingerprint.known_quick_hash())
+        
+        logger.info(f"処理中: {pdf_path}")
+        
+        # 内容が変わっていないファイルはキャッシュ済みの抽出結果を使い、PDFを解析しない
+        cached = None
+        if cache is not None and fingerprint:
+            with timed(timings, 'cache'):
+                read_before = fingerprint.bytes_read
+                cached = cache.lookup(fingerprint)
+                report.add_bytes_read('hash', fingerprint.bytes_read - read_before)
+            if cached:
+                logger.info(f"キャッシュ済みの抽出結果を使用します: {pdf_path}")
+                stats['cached'] += 1
+                cached = dict(cached, method='cached:' + (cached.get('method') or ''))
+        return fingerprint, cached, timings
+    
+    def record_extraction(self, pdf_path, fingerprint, info, timings):
+        """抽出結果を集計してキャッシュに保存し、類似論文を判定する"""
+        stats = self.stats
+        timings.update(info.get('timings', {}))
+        if info.get('budget_exceeded'):
+            stats['over_budget'] = stats.get('over_budget', 0) + 1
+        if info.get('pages'):
+            # PdfReaderはファイル全体を読み込む
+            self.report.add_bytes_read('extract', fingerprint.size if fingerprint else 0)
+        # PDFを解析したファイルのうち2ページ目まで必要だった件数を数える
+        if info.get('pages') == 0:
+            stats['metadata_only'] += 1
+        elif 'pages' in info:
+            stats['parsed'] += 1
+            if info['pages'] > 1:
+                stats['second_page'] += 1
+        # PDFを解析した場合は抽出時に計算したハッシュを使う（インデックスとキャッシュの登録のために読み直さない）
+        if fingerprint and (info.get('quick_hash') or info.get('hash')):
+            fingerprint.learn_hashes(info.get('quick_hash'), info.get('hash'))
+        # 抽出エラーは一時的な可能性があるためキャッシュしない
+        if (self.cache is not None and fingerprint
+                and info.get('method') != 'error' and not info.get('budget_exceeded') and 'timings' in info):
+            self.cache.put(fingerprint, info)
+        if self.near_detector is not None and info.get('method') != 'error' and not info.get('budget_exceeded'):
+            with timed(timings, 'near_duplicate'):
+                self.check_near_duplicate(pdf_path, info)
+    
+    def check_near_duplicate(self, pdf_path, info):
+        """登録済みの論文のバージョン違いや別のコピーであれば、設定に応じた扱いをinfoに記録する"""
+        features = paper_features(info)
+        info['features'] = features
+        match = self.near_detector.find(features)
+        if match is None:
+            self.near_detector.add(pdf_path, features, info['title'], info['author'])
+            return
+        key = 'on_newer_version' if match.relation == 'newer_version' else 'on_duplicate'
+        action = self.near_actions[key]
+        existing = match.output_filename or build_new_filename(match.title, match.author)
+        similarity = f"、類似度 {match.similarity:.2f}" if match.similarity is not None else ""
+        if match.relation == 'newer_version':
+            logger.warning(f"登録済みの論文の新しいバージョンです（{action}）: {pdf_path} → {existing}")
+            self.stats['newer_versions'] = self.stats.get('newer_versions', 0) + 1
+        else:
+            logger.warning(f"登録済みの論文と同じ論文の可能性があります（{action}{similarity}）: {pdf_path} → {existing}")
+            self.stats['near_duplicates'] = self.stats.get('near_duplicates', 0) + 1
+        self.report.add_near_duplicate(pdf_path, match, action)
+        filename = None
+        if action == 'group':
+            # 一致した論文のファイル名にバージョン（同じバージョンやarXiv以外は copy）を付けて並べる
+            versioned = match.relation != 'duplicate' and features.arxiv_version
+            label = f"v{features.arxiv_version}" if versioned else 'copy'
+            filename = f"{os.path.splitext(build_new_filename(match.title, match.author))[0]}_{label}.pdf"
+        info['near_duplicate'] = {'relation': match.relation, 'action': action, 'filename': filename}
+        if action != 'skip':
+            self.near_detector.add(pdf_path, features, info['title'], info['author'])
+    
+    def new_filename(self, info):
+        """出力ファイル名（類似論文としてまとめる場合は一致した論文に合わせた名前）"""
+        near = info.get('near_duplicate')
+        if near and near['filename']:
+            return near['filename']
+        return build_new_filename(info['title'], info['author'])
+    
+    def place(self, pdf_path, info, timings, stats):
+        """新しいファイル名を決めて出力フォルダにコピーし、処理済みフォルダに移動する（出力先のパスを返す）"""
+        if info.get('budget_exceeded') and self.quarantine_names is not None:
+            with timed(timings, 'move'):
+                self.quarantine(pdf_path)
+            stats['quarantined'] = stats.get('quarantined', 0) + 1
+            return None
+        if self.skip_near_duplicate(pdf_path, info, stats) or self.lost_claim(pdf_path, stats):
+            return None
+        with timed(timings, 'filename'):
+            new_filename = self.new_filename(info)
+        output_path, info['processed_path'] = place_file(
+            pdf_path, new_filename, self.output_folder, self.processed_folder, stats, self.report, timings,
+            self.placement, self.output_names, self.processed_names)
+        return output_path
+    
+    def place_member(self, member_path, spool, size, info, timings, stats):
+        """書庫内のPDFを読み込んだバッファから出力フォルダに書き出す（出力先のパスを返す）"""
+        if self.skip_near_duplicate(member_path, info, stats) or self.lost_claim(member_path, stats):
+            return None
+        with timed(timings, 'filename'):
+            new_filename = self.new_filename(info)
+        with timed(timings, 'place'):
+            output_path, _ = self.output_names.claim(new_filename, lambda path: write_stream_exclusive(spool, path))
+        self.report.add_bytes_written('copy', size)
+        logger.info(f"書庫から書き出しました: {member_path} → {output_path}")
+        stats['processed'] += 1
+        return output_path
+    
+    def lost_claim(self, pdf_path, stats):
+        """ロックが期限切れで他のノードに引き継がれていればTrueを返す（そのノードが処理する）"""
+        if self.coordinator is None or self.coordinator.holds(pdf_path):
+            return False
+        logger.warning(f"ロックが他のノードに引き継がれたためスキップします: {pdf_path}")
+        stats['skipped'] = stats.get('skipped', 0) + 1
+        return True
+    
+    def skip_near_duplicate(self, pdf_path, info, stats):
+        """類似論文をスキップする設定ならTrueを返す"""
+        near = info.get('near_duplicate')
+        if not near or near['action'] != 'skip':
+            return False
+        logger.info(f"類似論文のためスキップします: {pdf_path}")
+        stats['skipped'] = stats.get('skipped', 0) + 1
+        return True
+    
+    def retire_archive(self, archive_path):
+        """すべてのPDFを処理した書庫を処理済みフォルダへ移動する"""
+        processed_path, _ = self.processed_names.claim(os.path.basename(archive_path), reserve_file)
+        try:
+            move_file(archive_path, processed_path)
+        except Exception:
+            os.remove(processed_path)
+            self.processed_names.discard(os.path.basename(processed_path))
+            raise
+        logger.info(f"書庫を処理済みフォルダに移動しました: {archive_path} → {processed_path}")
+        self.stats['archives'] = self.stats.get('archives', 0) + 1
+    
+    def quarantine(self, pdf_path):
+        """抽出処理が上限を超えたファイルを隔離フォルダへ移動する"""
+        quarantine_path, _ = self.quarantine_names.claim(os.path.basename(pdf_path), reserve_file)
+        try:
+            move_file(pdf_path, quarantine_path)
+        except Exception:
+            os.remove(quarantine_path)
+            self.quarantine_names.discard(os.path.basename(quarantine_path))
+            raise
+        logger.warning(f"隔離フォルダに移動しました: {pdf_path} → {quarantine_path}")
+    
+    def extract(self, pdf_path, options, profile_dir=None):
+        """抽出処理を実行する（sandboxがあれば隔離されたワーカーで実行する）"""
+        if self.sandbox is not None:
+            return self.sandbox.extract(pdf_path, options)
+        return run_extractor(pdf_path, options, profile_dir)
+    
+    def commit(self, pdf_path, fingerprint, info, timings, output_path):
+        """配置結果をインデックスに登録する（output_pathがNoneなら失敗として扱う）"""
+        if output_path is None:
+            near = info.get('near_duplicate')
+            if near and near['action'] == 'skip':
+                # 類似論文としてスキップしたファイルは重複の判定に残し、入力フォルダに残っても
+                # 変更がなければ次回の走査で抽出や警告を繰り返さない
+                if self.snapshot is not None and fingerprint:
+                    self.snapshot.trust(pdf_path, fingerprint.stat_key)
+            elif fingerprint:
+                # 失敗したファイルは後続の同一内容ファイルで再試行できるようにする
+                self.detector.discard(fingerprint)
+        elif fingerprint:
+            # 元ファイルは移動されるため、以降の比較は処理済みフォルダの元ファイルか同じ内容の出力ファイルで行う
+            fingerprint.path = output_path
+            fingerprint.processed_path = info.get('processed_path')
+            # 出力ファイルが後で移動・編集されても内容で判定できるよう、部分ハッシュは必ず登録する
+            # （先頭と末尾のブロックだけを読む。全体ハッシュは計算済みの場合だけ登録する）
+            fingerprint.quick_hash()
+            file_id = self.hash_index.record(fingerprint, os.path.basename(output_path), pdf_path, info['title'],
+                                             info['author'], processed_path=fingerprint.processed_path)
+            if info.get('features'):
+                self.hash_index.record_paper(file_id, info['features'])
+            if self.coordinator is not None:
+                self.coordinator.record(fingerprint, os.path.basename(output_path), pdf_path, info['title'],
+                                        info['author'], info.get('features'), fingerprint.processed_path)
+        # 登録済みの論文はインデックスで判定する（失敗した場合は判定の対象から外す）
+        if self.near_detector is not None:
+            self.near_detector.discard(pdf_path)
+        if self.coordinator is not None:
+            self.coordinator.release(pdf_path)
+        self.report.add_file(pdf_path, timings, info.get('method') or 'unknown')
+    
+    def finish(self, pdf_path, fingerprint, info, timings):
+        """抽出結果の集計から配置・インデックス登録までを続けて行う"""
+        self.record_extraction(pdf_path, fingerprint, info, timings)
+        if self.manifest is not None:
+            near = info.get('near_duplicate')
+            if near and near['action'] == 'skip':
+                logger.info(f"類似論文のためマニフェストに含めません: {pdf_path}")
+                self.stats['skipped'] += 1
+            else:
+                self.manifest.add(pdf_path, fingerprint, info, self.new_filename(info))
+            if self.coordinator is not None:
+                self.coordinator.release(pdf_path)
+            self.report.add_file(pdf_path, timings, info.get('method') or 'unknown')
+            return
+        output_path = None
+        try:
+            output_path = self.place(pdf_path, info, timings, self.stats)
+        except Exception as e:
+            logger.error(f"ファイル処理中にエラーが発生しました: {pdf_path} - {str(e)}")
+        self.commit(pdf_path, fingerprint, info, timings, output_path)
+
+def process_pdf_files(pdf_paths, config, stats, hash_index, workers=1, cache=None, report=None, profile_dir=None,
+                      snapshot=None, ingester=None, sandbox=None, manifest=None, coordinator=None, executor=None):
+    """PDFを重複チェック・抽出・コピー・移動する一連の処理を実行する（manifestを渡すと予定の書き出しのみ）
+    
+    executorを渡すと並列抽出にそのプールを使い、終了後もワーカーを残す
+    """
+    options = extractor_options(config)
+    if ingester is None:
+        ingester = Ingester(config, stats, hash_index, cache, report, snapshot, sandbox, manifest, coordinator)
+    # 抽出結果が返るまで識別情報と段階別処理時間を保持する
+    pending = {}
+    
+    def unique_pdf_paths():
+        """重複ファイルを除外しながら処理対象のPDFを列挙する"""
+        for pdf_path in ingester.claim_paths(pdf_paths):
+            screened = ingester.screen(pdf_path)
+            if screened is None:
+                continue
+            fingerprint, cached, timings = screened
+            pending[pdf_path] = (fingerprint, timings)
+            yield pdf_path, cached
+    
+    if ingester.sandbox is not None:
+        results = iter_extracted_parallel(unique_pdf_paths(), ingester.sandbox.workers, options, profile_dir,
+                                          ingester.sandbox, executor)
+    elif workers > 1:
+        logger.info(f"{workers}プロセスで並列に抽出します")
+        results = iter_extracted_parallel(unique_pdf_paths(), workers, options, profile_dir, executor=executor)
+    else:
+        results = ((pdf_path, cached or ingester.extract(pdf_path, options, profile_dir))
+                   for pdf_path, cached in unique_pdf_paths())
+    
+    # コピー・移動・重複管理は親プロセスで完了順に行う
+    for pdf_path, info in results:
+        fingerprint, timings = pending.pop(pdf_path, (None, {}))
+        ingester.finish(pdf_path, fingerprint, info, timings)
+
+def pipeline_options(config, workers):
+    """設定ファイルからパイプラインの各段階の並列数とキューの長さを読み込む"""
+    pipeline = config.get('pipeline') or {}
+    if not isinstance(pipeline, dict):
+        pipeline = {}
+    
+    def positive(key, default):
+        try:
+            return max(1, int(pipeline.get(key) or default))
+        except (TypeError, ValueError):
+            logger.warning(f"pipeline.{key} の値が不正なため {default} を使用します")
+            return default
+    
+    return {
+        'queue_size': positive('queue_size', 32),
+        'hash_threads': positive('hash_threads', 4),
+        'extract_workers': positive('extract_workers', workers),
+        'place_threads': positive('place_threads', 2),
+    }
+
+async def _run_pipeline(pdf_paths, ingester, options, pipeline, profile_dir=None, extract_executor=None):
+    """走査→重複チェック→抽出→配置を、長さ制限付きキューでつないだ段階ごとに並行して実行する
+    
+    extract_executorを渡すと抽出段階にそのプールを使い、終了時にシャットダウンしない
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+    queue_size = pipeline['queue_size']
+    scanned = asyncio.Queue(queue_size)
+    hashed = asyncio.Queue(queue_size)
+    to_extract = asyncio.Queue(queue_size)
+    to_place = asyncio.Queue(queue_size)
+    
+    # SQLite（インデックスとキャッシュ）は1つのスレッドからだけ使う
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    scan_executor = ThreadPoolExecutor(max_workers=1)
+    hash_executor = ThreadPoolExecutor(max_workers=pipeline['hash_threads'])
+    place_executor = ThreadPoolExecutor(max_workers=pipeline['place_threads'])
+    # 隔離されたワーカーを使う場合、抽出段階のスレッドはワーカーの処理完了を待つだけ
+    owns_extract_executor = extract_executor is None
+    if owns_extract_executor:
+        executor_class = ThreadPoolExecutor if ingester.sandbox is not None else ProcessPoolExecutor
+        extract_executor = executor_class(max_workers=pipeline['extract_workers'])
+    
+    async def scan():
+        """入力フォルダの走査はスレッドで行い、キューが一杯なら待つ"""
+        paths = iter(pdf_paths)
+        while True:
+            pdf_path = await loop.run_in_executor(scan_executor, next, paths, done)
+            if pdf_path is done:
+                return
+            await scanned.put(pdf_path)
+    
+    def stat_file(pdf_path):
+        timings = {}
+        with timed(timings, 'hash'):
+            fingerprint = FileFingerprint.from_path(pdf_path)
+            if fingerprint:
+                # 同じサイズの登録済みファイルがある場合のハッシュ計算もこのスレッドで行い、
+                # 重複判定（SQLiteのスレッド）ではインデックスとキャッシュの検索だけを行う
+                ingester.report.add_bytes_read('hash', ingester.prefetch_hashes(fingerprint))
+        return pdf_path, fingerprint, timings
+    
+    async def hash_files():
+        """ファイル情報の取得とハッシュ計算は複数スレッドで行い、ネットワーク上のフォルダでも待ち時間を重ねる"""
+        while True:
+            pdf_path = await scanned.get()
+            if pdf_path is done:
+                return
+            await hashed.put(await loop.run_in_executor(hash_executor, stat_file, pdf_path))
+    
+    async def screen():
+        """重複判定は1件ずつ行う（同じ内容のファイルを二重に抽出しないため）"""
+        while True:
+            item = await hashed.get()
+            if item is done:
+                return
+            pdf_path = item[0]
+            screened = await loop.run_in_executor(db_executor, ingester.screen_fingerprint, *item)
+            if screened is not None:
+                await to_extract.put((pdf_path,) + screened)
+    
+    async def extract():
+        while True:
+            item = await to_extract.get()
+            if item is done:
+                return
+            pdf_path, fingerprint, cached, timings = item
+            info = cached
+            if info is None and ingester.sandbox is not None:
+                _, info = await loop.run_in_executor(extract_executor, _sandbox_task, ingester.sandbox, pdf_path,
+                                                     options)
+            elif info is None:
+                _, info = await loop.run_in_executor(extract_executor, _extract_worker, pdf_path, options, profile_dir)
+            await loop.run_in_executor(db_executor, ingester.record_extraction, pdf_path, fingerprint, info, timings)
+            await to_place.put((pdf_path, fingerprint, info, timings))
+    
+    async def place():
+        while True:
+            item = await to_place.get()
+            if item is done:
+                return
+            pdf_path, fingerprint, info, timings = item
+            # 件数はスレッドごとに数えてからまとめる
+            counts = {'processed': 0, 'moved': 0}
+            output_path = None
+            try:
+                output_path = await loop.run_in_executor(place_executor, ingester.place, pdf_path, info, timings, counts)
+            except Exception as e:
+                logger.error(f"ファイル処理中にエラーが発生しました: {pdf_path} - {str(e)}")
+            for key, count in counts.items():
+                ingester.stats[key] = ingester.stats.get(key, 0) + count
+            await loop.run_in_executor(db_executor, ingester.commit, pdf_path, fingerprint, info, timings, output_path)
+    
+    async def stage(workers, outbox, count):
+        """段階のタスクがすべて終わったら、次の段階のタスク数だけ終了の印を送る"""
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            if outbox is not None:
+                for _ in range(count):
+                    await outbox.put(done)
+    
+    hash_count = pipeline['hash_threads']
+    extract_count = pipeline['extract_workers']
+    place_count = pipeline['place_threads']
+    try:
+        await loop.run_in_executor(db_executor, ingester.load_hash_hints)
+        await asyncio.gather(
+            stage([scan()], scanned, hash_count),
+            stage([hash_files() for _ in range(hash_count)], hashed, 1),
+            stage([screen()], to_extract, extract_count),
+            stage([extract() for _ in range(extract_count)], to_place, place_count),
+            stage([place() for _ in range(place_count)], None, 0),
+        )
+    finally:
+        if owns_extract_executor:
+            extract_executor.shutdown()
+        for executor in (scan_executor, hash_executor, place_executor, db_executor):
+            executor.shutdown()
+
+def process_pdf_files_pipelined(pdf_paths, config, stats, hash_index, workers=1, cache=None, report=None,
+                                profile_dir=None, snapshot=None, sandbox=None, coordinator=None, ingester=None,
+                                executor=None):
+    """ディスクI/OとPDFの解析を重ねて実行するパイプライン版の process_pdf_files()"""
+    if ingester is None:
+        ingester = Ingester(config, stats, hash_index, cache, report, snapshot, sandbox, coordinator=coordinator)
+    pipeline = pipeline_options(config, workers)
+    logger.info(f"パイプラインで処理します（ハッシュ: {pipeline['hash_threads']}スレッド、"
+                f"抽出: {pipeline['extract_workers']}プロセス、配置: {pipeline['place_threads']}スレッド、"
+                f"キュー長: {pipeline['queue_size']}）")
+    asyncio.run(_run_pipeline(ingester.claim_paths(pdf_paths), ingester, extractor_options(config), pipeline, profile_dir,
+                              executor))
+
+# 入力フォルダ内で展開せずに読み込む書庫の拡張子
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+def is_archive_name(name):
+    """zip・tarの書庫のファイル名かどうか"""
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_pdf_member_name(name):
+    """書庫内のPDFかどうか（macOSが作成するリソースフォークのファイルは除く）"""
+    parts = name.replace('\\', '/').split('/')
+    return parts[-1].lower().endswith('.pdf') and not parts[-1].startswith('._') and '__MACOSX' not in parts
+
+def archive_options(config):
+    """設定ファイルから書庫の読み込みの設定を読み込む（無効ならNone）"""
+    archives = config.get('archives') or {}
+    if not isinstance(archives, dict) or not archives.get('enabled', False):
+        return None
+    return {
+        # これより大きいPDFはメモリではなく一時ファイルに読み込む
+        'spool_max_bytes': int(float(archives.get('spool_max_mb', 64) or 64) * 1024 * 1024),
+        # 展開後のサイズがこれより大きいPDFは読み込まない（0で無制限）
+        'max_member_bytes': int(float(archives.get('max_member_mb', 512) or 0) * 1024 * 1024),
+    }
+
+def iter_archive_members(archive_path):
+    """書庫内のPDFを (書庫内のパス, 読み込み用のファイルオブジェクトまたはNone, 展開後のサイズ) の順に返す
+    
+    tarはストリームとして先頭から1回だけ読むため、圧縮されていても書庫全体を展開しない。
+    暗号化されたzipのメンバーは読み込めないため、ファイルオブジェクトをNoneとして返す
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not is_pdf_member_name(info.filename):
+                    continue
+                if info.flag_bits & 0x1:
+                    yield info.filename, None, info.file_size
+                    continue
+                with zf.open(info) as member:
+                    yield info.filename, member, info.file_size
+        return
+    with tarfile.open(archive_path, mode='r|*') as tar:
+        for info in tar:
+            if not info.isfile() or not is_pdf_member_name(info.name):
+                continue
+            member = tar.extractfile(info)
+            if member is not None:
+                yield info.name, member, info.size
+
+def spool_member(source, spool_max_bytes):
+    """書庫のメンバーを読み込みながら全体ハッシュを計算し、(バッファ, サイズ, 全体ハッシュ) を返す
+    
+    spool_max_bytes以下のPDFはメモリ上に置き、それより大きい場合のみ一時ファイルに書き出す
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    try:
+        md5 = hashlib.md5()
+        size = 0
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size, md5.hexdigest()
+
+def write_stream_exclusive(stream, path):
+    """ストリームの内容をpathに排他的に書き出す（存在する場合はFileExistsError）"""
+    stream.seek(0)
+    with open(path, 'xb') as f:
+        shutil.copyfileobj(stream, f, HASH_CHUNK_SIZE)
+
+def ingest_archive(archive_path, ingester, options, spool_max_bytes, max_member_bytes=0):
+    """書庫内のPDFを展開せずに重複チェック・抽出・出力する（すべて処理できればTrue）
+    
+    メンバーは読み込んだバッファから直接ハッシュ計算と解析を行い、出力フォルダにはリネームしたPDFだけを書き出す
+    """
+    stats = ingester.stats
+    complete = True
+    logger.info(f"書庫を処理中: {archive_path}")
+    try:
+        for name, source, declared_size in iter_archive_members(archive_path):
+            member_path = os.path.join(archive_path, name)
+            if source is None or (max_member_bytes and declared_size > max_member_bytes):
+                reason = "暗号化されている" if source is None else "サイズが上限を超えている"
+                logger.warning(f"書庫内のPDFが{reason}ためスキップします: {member_path}")
+                stats['total'] += 1
+                stats['skipped'] += 1
+                continue
+            if not ingest_archive_member(member_path, source, ingester, options, spool_max_bytes):
+                complete = False
+    except Exception as e:
+        logger.error(f"書庫の読み込み中にエラーが発生しました: {archive_path} - {str(e)}")
+        return False
+    return complete
+
+def ingest_archive_member(member_path, source, ingester, options, spool_max_bytes):
+    """書庫内の1つのPDFを処理する（出力に失敗した場合はFalse）"""
+    timings = {}
+    with timed(timings, 'hash'):
+        spool, size, full_hash = spool_member(source, spool_max_bytes)
+    try:
+        ingester.report.add_bytes_read('hash', size)
+        with timed(timings, 'hash'):
+            fingerprint = FileFingerprint(member_path, size, quick_hash_of_stream(spool, size), full_hash)
+        screened = ingester.screen_fingerprint(member_path, fingerprint, timings)
+        if screened is None:
+            return True
+        fingerprint, cached, timings = screened
+        # 書庫内のPDFは別プロセスに渡せないため、budgetの設定にかかわらずこのプロセスで抽出する
+        info = cached or extract_paper_info(member_path, stream=spool, **options)
+        ingester.record_extraction(member_path, fingerprint, info, timings)
+        output_path = None
+        failed = False
+        try:
+            output_path = ingester.place_member(member_path, spool, size, info, timings, ingester.stats)
+        except Exception as e:
+            logger.error(f"ファイル処理中にエラーが発生しました: {member_path} - {str(e)}")
+            failed = True
+        ingester.commit(member_path, fingerprint, info, timings, output_path)
+        return not failed
+    finally:
+        spool.close()
+
+def process_archive_files(archive_paths, config, stats, hash_index, cache=None, report=None, snapshot=None,
+                          coordinator=None, ingester=None):
+    """入力フォルダ内の書庫を処理し、すべてのPDFを処理できた書庫を処理済みフォルダに移動する
+    
+    途中で失敗した書庫は入力フォルダに残し、次回の実行で処理し直す（処理済みのPDFはインデックスでスキップされる）
+    """
+    options = archive_options(config)
+    if options is None or not archive_paths:
+        return
+    if ingester is None:
+        ingester = Ingester(config, stats, hash_index, cache, report, snapshot, coordinator=coordinator)
+    extract_options = extractor_options(config)
+    for archive_path in ingester.claim_paths(archive_paths):
+        try:
+            if ingest_archive(archive_path, ingester, extract_options, options['spool_max_bytes'],
+                              options['max_member_bytes']):
+                ingester.retire_archive(archive_path)
+            else:
+                logger.warning(f"書庫内に処理できなかったPDFがあるため、書庫を入力フォルダに残します: {archive_path}")
+        except Exception as e:
+            logger.error(f"書庫の移動中にエラーが発生しました: {archive_path} - {str(e)}")
+        finally:
+            if coordinator is not None:
+                coordinator.release(archive_path)
+
+MANIFEST_VERSION = 1
+
+class PlanManifest:
+    """planフェーズで決めたコピー・移動の予定をJSON Lines形式のマニフェストに書き出す
+    
+    1行目はヘッダー、2行目以降が1ファイル1行のエントリ。内容を確認・編集してから --apply で実行できる
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        # 書き込みが完了するまでは一時ファイルに書き、最後に置き換える
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'w', encoding='utf-8')
+        self._write({'manifest_version': MANIFEST_VERSION, 'extractor_version': EXTRACTOR_VERSION,
+                     'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    
+    def add(self, pdf_path, fingerprint, info, filename=None):
+        self.count += 1
+        size, mtime_ns, _ = fingerprint.stat_key if fingerprint and fingerprint.stat_key else (None, None, None)
+        features = info.get('features')
+        self._write({
+            'id': self.count,
+            'source': pdf_path,
+            'filename': filename or build_new_filename(info['title'], info['author']),
+            'title': info['title'],
+            'author': info['author'],
+            'method': info.get('method'),
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'quick_hash': fingerprint.known_quick_hash() if fingerprint else None,
+            'hash': fingerprint.known_full_hash() if fingerprint else None,
+            # 適用時に類似論文の判定用の特徴をインデックスに登録する
+            'arxiv_id': info.get('arxiv_id'),
+            'sketch': pack_sketch(features.sketch).hex() if features and features.sketch else None,
+        })
+    
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+def read_manifest(path):
+    """マニフェストを読み込み、(ヘッダー, エントリのリスト) を返す"""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"マニフェストが空です: {path}")
+    header = json.loads(lines[0])
+    if header.get('manifest_version') != MANIFEST_VERSION:
+        raise ValueError(f"対応していないマニフェストの形式です: {path}")
+    return header, [json.loads(line) for line in lines[1:]]
+
+class Journal:
+    """applyフェーズの進行状況を記録する追記専用のジャーナル（fsyncはbatch_size件ごとにまとめて行う）"""
+    
+    def __init__(self, path, batch_size=64):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        # エントリID → 記録済みの状態（後の記録ほど優先）
+        self.states = {}
+        # 前回の実行のジャーナルがある（中断からの再開）
+        self.resumed = os.path.exists(path)
+        if self.resumed:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で中断された最後の行
+                        continue
+                    self.states.setdefault(record['id'], {}).update(record)
+        # 前回の実行で記録が始まっていたエントリ（中断からの再開）
+        self.recovered = set(self.states)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.unsynced = 0
+    
+    def append(self, entry_id, state, **fields):
+        record = dict({'id': entry_id, 'state': state}, **fields)
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.states.setdefault(entry_id, {}).update(record)
+        self.unsynced += 1
+        if self.unsynced >= self.batch_size:
+            self.sync()
+    
+    def sync(self):
+        if self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+    
+    def close(self):
+        self.sync()
+        self.file.close()
+
+def find_placed_output(output_folder, filename, processed_path):
+    """処理済みファイルと同じ内容の出力ファイルを連番の候補から探す（記録前に中断した場合の再開用）"""
+    base_name, ext = os.path.splitext(filename)
+    size = os.path.getsize(processed_path)
+    counter = 0
+    while True:
+        name = filename if counter == 0 else f"{base_name}_{counter}{ext}"
+        path = os.path.join(output_folder, name)
+        if not os.path.exists(path):
+            return None
+        if os.path.samefile(path, processed_path) or (
+                os.path.getsize(path) == size and compute_file_hash(path) == compute_file_hash(processed_path)):
+            return path
+        counter += 1
+
+def apply_manifest(manifest_path, config, stats, hash_index, report=None, batch_size=64):
+    """マニフェストのコピー・移動をジャーナルに記録しながら実行する（中断した場合は続きから再開する）
+    
+    batch_size件ごとに、移動先の名前の確保をジャーナルに記録してfsyncしてから移動・配置を行うため、
+    ジャーナルの記録が失われた操作もディスクの状態から判断して二重に実行しない
+    """
+    _, entries = read_manifest(manifest_path)
+    journal = Journal(manifest_path + '.journal', batch_size)
+    if journal.resumed:
+        _remove_orphan_reservations(entries, journal, config['processed_folder'])
+    ingester = Ingester(config, stats, hash_index, report=report)
+    remaining = [entry for entry in entries
+                 if journal.states.get(entry['id'], {}).get('state') not in ('done', 'skipped')]
+    if len(remaining) < len(entries):
+        logger.info(f"ジャーナルから再開します: {len(entries) - len(remaining)}件は適用済みです")
+    
+    try:
+        for start in range(0, len(remaining), journal.batch_size):
+            batch = remaining[start:start + journal.batch_size]
+            # 1. 移動先の名前を確保してジャーナルに記録し、まとめてfsyncする
+            for entry in batch:
+                if 'processed' not in journal.states.get(entry['id'], {}):
+                    _reserve_entry(entry, journal, ingester)
+            journal.sync()
+            # 2. 移動・配置・インデックス登録を行う
+            for entry in batch:
+                if journal.states.get(entry['id'], {}).get('state') in ('done', 'skipped'):
+                    continue
+                timings = {}
+                try:
+                    _apply_entry(entry, journal, ingester, timings)
+                except Exception as e:
+                    logger.error(f"ファイル処理中にエラーが発生しました: {entry['source']} - {str(e)}")
+                ingester.report.add_file(entry['source'], timings, 'apply')
+            journal.sync()
+    finally:
+        journal.close()
+
+def _remove_orphan_reservations(entries, journal, processed_folder):
+    """名前を確保した後、ジャーナルをfsyncする前に中断した場合に残った空のファイルを削除する"""
+    recorded = {os.path.normcase(state['processed']) for state in journal.states.values() if 'processed' in state}
+    removed = 0
+    for entry in entries:
+        if 'processed' in journal.states.get(entry['id'], {}):
+            continue
+        # 確保した名前は元ファイル名とその連番のいずれか
+        base_name, ext = os.path.splitext(os.path.basename(entry['source']))
+        counter = 0
+        while True:
+            name = f"{base_name}{ext}" if counter == 0 else f"{base_name}_{counter}{ext}"
+            path = os.path.join(processed_folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                break
+            if st.st_size == 0 and os.path.normcase(path) not in recorded:
+                os.remove(path)
+                removed += 1
+            counter += 1
+    if removed:
+        logger.info(f"中断時に残った移動先の確保用ファイル{removed}件を削除しました")
+
+def manifest_filename(entry):
+    """マニフェストの出力ファイル名を検証する（フォルダを含む名前は名前部分だけを使い、PDF以外はNone）"""
+    filename = sanitize_filename(os.path.basename(str(entry.get('filename') or '').replace('\\', '/')))
+    base_name, ext = os.path.splitext(filename)
+    if not base_name.strip(' .') or ext.lower() != '.pdf':
+        return None
+    return filename
+
+def _reserve_entry(entry, journal, ingester):
+    """元ファイルが計画時と同じか確認し、処理済みフォルダでの名前を確保する"""
+    source = entry['source']
+    try:
+        st = os.stat(source)
+    except OSError:
+        logger.warning(f"元ファイルが見つからないためスキップします: {source}")
+        journal.append(entry['id'], 'skipped', reason='missing')
+        ingester.stats['skipped'] += 1
+        return
+    if entry.get('size') is not None and (st.st_size, st.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+        logger.warning(f"計画後に変更されたためスキップします: {source}")
+        journal.append(entry['id'], 'skipped', reason='changed')
+        ingester.stats['skipped'] += 1
+        return
+    if manifest_filename(entry) is None:
+        logger.warning(f"出力ファイル名が不正なためスキップします（.pdfで終わる名前を指定してください）: {entry.get('filename')}")
+        journal.append(entry['id'], 'skipped', reason='invalid_filename')
+        ingester.stats['skipped'] += 1
+        return
+    # 計画後に別の実行で同じ内容のファイルが処理されていないか確認する
+    fingerprint = FileFingerprint(source, st.st_size, entry.get('quick_hash'), entry.get('hash'))
+    duplicate = ingester.detector.find_duplicate(fingerprint)
+    if duplicate:
+        logger.info(f"重複ファイルのためスキップします: {source}")
+        journal.append(entry['id'], 'skipped', reason='duplicate')
+        ingester.stats['skipped'] += 1
+        return
+    ingester.detector.add(fingerprint)
+    processed_path, _ = ingester.processed_names.claim(os.path.basename(source), reserve_file)
+    journal.append(entry['id'], 'reserved', processed=processed_path)
+
+def _apply_entry(entry, journal, ingester, timings):
+    """確保済みの名前への移動、出力ファイルの配置、インデックス登録を、未完了の手順から実行する"""
+    source = entry['source']
+    state = journal.states[entry['id']]
+    processed_path = state['processed']
+    filename = manifest_filename(entry)
+    
+    if state['state'] == 'reserved':
+        if os.path.exists(source):
+            with timed(timings, 'move'):
+                # 確保用の空ファイルを置き換える
+                move_file(source, processed_path)
+            logger.info(f"移動完了: {source} → {processed_path}")
+            ingester.stats['moved'] += 1
+        elif not (os.path.exists(processed_path) and os.path.getsize(processed_path) == entry.get('size')):
+            raise FileNotFoundError(f"元ファイルも移動先のファイルも見つかりません: {processed_path}")
+        journal.append(entry['id'], 'moved')
+    
+    output_path = state.get('output')
+    if output_path is None:
+        with timed(timings, 'place'):
+            # 中断前に配置済みで記録だけが失われた場合は、その出力ファイルを使う
+            output_path = None
+            if entry['id'] in journal.recovered:
+                output_path = find_placed_output(ingester.output_folder, filename, processed_path)
+            if output_path is None:
+                output_path, method = ingester.output_names.claim(
+                    filename, lambda path: materialize_file(processed_path, path, ingester.placement))
+                logger.info(f"配置完了（{method}）: {output_path}")
+        ingester.stats['processed'] += 1
+        journal.append(entry['id'], 'placed', output=output_path)
+    
+    size = os.path.getsize(processed_path)
+    output_filename = os.path.basename(output_path)
+    if not any(os.path.basename(row.path) == output_filename for row in ingester.hash_index.candidates(size)):
+        fingerprint = FileFingerprint(processed_path, size, entry.get('quick_hash'), entry.get('hash'))
+        fingerprint.quick_hash()
+        file_id = ingester.hash_index.record(fingerprint, output_filename, source, entry['title'], entry['author'],
+                                             processed_path=processed_path)
+        sketch = unpack_sketch(bytes.fromhex(entry['sketch'])) if entry.get('sketch') else None
+        ingester.hash_index.record_paper(file_id, paper_features(dict(entry, sketch=sketch)))
+    journal.append(entry['id'], 'done')
+
+# inotifyのイベント（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+def _load_libc():
+    """inotifyを使えるlibcを読み込む（使えない環境ではNone）"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class InotifyWatcher:
+    """inotifyで入力フォルダ（サブフォルダを含む）に追加・書き込みされたPDF（archivesがTrueなら書庫も）を検出する"""
+    
+    MASK = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+    
+    def __init__(self, input_folders, exclude_folders=(), exclude_patterns=None, follow_symlinks=False,
+                 archives=False):
+        self.libc = _load_libc()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, "inotifyを使用できません")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1に失敗しました")
+        self.input_folders = input_folders
+        self.exclude_folders = exclude_folders
+        self.exclude_patterns = exclude_patterns
+        self.follow_symlinks = follow_symlinks
+        self.archives = archives
+        self.excluded = {identity for identity in map(_dir_identity, exclude_folders) if identity}
+        self.exclude_re = compile_exclude_patterns(exclude_patterns)
+        # 監視ID → (フォルダのパス, 入力フォルダからの相対パス)
+        self.watches = {}
+        self.watched = set()
+        try:
+            for folder_path in unique_roots(input_folders):
+                self._add_tree(folder_path, '')
+        except OSError:
+            self.close()
+            raise
+    
+    def _wanted(self, name):
+        return name.lower().endswith('.pdf') or (self.archives and is_archive_name(name))
+    
+    def _excluded_name(self, name, rel_path):
+        return bool(self.exclude_re and (self.exclude_re.match(os.path.normcase(name))
+                                         or self.exclude_re.match(os.path.normcase(rel_path))))
+    
+    def _add_tree(self, folder_path, rel_dir):
+        """フォルダとそのサブフォルダを監視対象に追加し、中にあるPDFのパスを返す"""
+        found = []
+        stack = [(folder_path, rel_dir)]
+        while stack:
+            dir_path, rel_dir = stack.pop()
+            identity = _dir_identity(dir_path)
+            if identity is None or identity in self.excluded or identity in self.watched:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    # fs.inotify.max_user_watches の上限に達した
+                    raise OSError(error, "inotifyの監視数が上限に達しました")
+                logger.warning(f"フォルダを監視できません: {dir_path} - {os.strerror(error)}")
+                continue
+            self.watched.add(identity)
+            self.watches[wd] = (dir_path, rel_dir)
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        rel_path = rel_dir + entry.name
+                        if self._excluded_name(entry.name, rel_path):
+                            continue
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            stack.append((entry.path, rel_path + '/'))
+                        elif self._wanted(entry.name):
+                            found.append(entry.path)
+            except OSError as e:
+                logger.warning(f"フォルダを読み込めません: {dir_path} - {str(e)}")
+        return found
+    
+    def wait(self, timeout):
+        """イベントを待ち、追加・変更されたPDFのパスを返す（timeoutがNoneなら無期限に待つ）"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        paths = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0'))
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # イベントの取りこぼしがあったため、入力フォルダ全体を確認し直す
+                    logger.warning("inotifyのイベントキューが溢れたため、入力フォルダを走査し直します")
+                    archives = [] if self.archives else None
+                    paths.extend(iter_pdf_files(self.input_folders, self.exclude_folders, self.exclude_patterns,
+                                                self.follow_symlinks, archives=archives))
+                    paths.extend(archives or ())
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                if wd not in self.watches or not name:
+                    continue
+                dir_path, rel_dir = self.watches[wd]
+                path = os.path.join(dir_path, name)
+                rel_path = rel_dir + name
+                if self._excluded_name(name, rel_path):
+                    continue
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # 新しいフォルダは監視対象に加え、監視開始前に置かれたPDFも拾う
+                        paths.extend(self._add_tree(path, rel_path + '/'))
+                elif self._wanted(name):
+                    paths.append(path)
+        return paths
+    
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """入力フォルダを定期的に走査し、追加・変更されたPDF（archivesがTrueなら書庫も）を検出する（inotifyを使えない環境用）"""
+    
+    def __init__(self, input_folders, exclude_folders=(), exclude_patterns=None, follow_symlinks=False,
+                 interval=5.0, archives=False):
+        self.input_folders = input_folders
+        self.archives = archives
+        self.exclude_folders = exclude_folders
+        self.exclude_patterns = exclude_patterns
+        self.follow_symlinks = follow_symlinks
+        self.interval = interval
+        # 開始時点で存在するファイルは最初の処理で扱うため、変更があった場合のみ返す
+        self.seen = self._scan()
+        self.scanned_at = time.monotonic()
+    
+    def _scan(self):
+        current = {}
+        archives = [] if self.archives else None
+        paths = list(iter_pdf_files(self.input_folders, self.exclude_folders, self.exclude_patterns,
+                                    self.follow_symlinks, verbose=False, archives=archives))
+        for pdf_path in paths + (archives or []):
+            try:
+                st = os.stat(pdf_path)
+            except OSError:
+                continue
+            current[pdf_path] = (st.st_size, st.st_mtime_ns)
+        return current
+    
+    def wait(self, timeout):
+        """次の走査まで待ち、前回の走査から追加・変更されたPDFのパスを返す"""
+        remaining = self.scanned_at + self.interval - time.monotonic()
+        if timeout is not None and timeout < remaining:
+            # 保留中のファイルの確認を優先し、走査は間隔が空くまで行わない
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, remaining))
+        current = self._scan()
+        self.scanned_at = time.monotonic()
+        changed = [path for path, key in current.items() if self.seen.get(path) != key]
+        self.seen = current
+        return changed
+    
+    def close(self):
+        pass
+
+class PendingFiles:
+    """書き込み中のファイルを、サイズとmtimeが一定時間変わらなくなるまで保留する"""
+    
+    def __init__(self, settle_seconds=2.0):
+        self.settle_seconds = settle_seconds
+        # パス → ((サイズ, mtime), 最後に変化を確認した時刻)
+        self.files = {}
+    
+    def add(self, path):
+        self.files.setdefault(path, (None, time.monotonic()))
+    
+    def ready(self):
+        """書き込みが終わったと判断できるファイルを取り出す"""
+        now = time.monotonic()
+        ready = []
+        for path, (key, changed_at) in list(self.files.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # 処理済みフォルダへ移動されたなど
+                del self.files[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key or st.st_size == 0:
+                self.files[path] = (current, now)
+            elif now - changed_at >= self.settle_seconds:
+                del self.files[path]
+                ready.append(path)
+        return ready
+    
+    def timeout(self):
+        """次に ready() を確認するまでの秒数（保留中のファイルがなければNone）"""
+        if not self.files:
+            return None
+        return max(0.1, self.settle_seconds / 2)
+
+def create_watcher(config, input_folders, exclude_folders, exclude_patterns, follow_symlinks):
+    """設定に応じてinotifyまたはポーリングの監視を作成する"""
+    watch = config.get('watch') or {}
+    if not isinstance(watch, dict):
+        watch = {}
+    backend = watch.get('backend', 'auto')
+    # 書庫を読み込む設定なら、監視中に置かれた書庫も処理する
+    archives = archive_options(config) is not None
+    if backend in ('auto', 'inotify'):
+        try:
+            watcher = InotifyWatcher(input_folders, exclude_folders, exclude_patterns, follow_symlinks, archives)
+            logger.info(f"inotifyで入力フォルダを監視します（{len(watcher.watches)}フォルダ）")
+            return watcher
+        except OSError as e:
+            logger.warning(f"inotifyを使用できないため、ポーリングで監視します: {str(e)}")
+    interval = float(watch.get('poll_interval', 5) or 5)
+    logger.info(f"{interval}秒ごとに入力フォルダを走査して監視します")
+    return PollingWatcher(input_folders, exclude_folders, exclude_patterns, follow_symlinks, interval, archives)
+
+def watch_input_folders(watcher, config, stats, hash_index, workers=1, cache=None, report=None, profile_dir=None,
+                        snapshot=None, sandbox=None, coordinator=None, use_pipeline=False):
+    """入力フォルダに追加されたPDFと書庫を、書き込みが終わるのを待ってから順次処理する（SIGINT/SIGTERMで終了）
+    
+    use_pipelineがTrueなら検出したファイルごとのまとまりをパイプラインで処理する
+    """
+    watch = config.get('watch') or {}
+    if not isinstance(watch, dict):
+        watch = {}
+    pending = PendingFiles(float(watch.get('settle_seconds', 2) or 0))
+    # 出力フォルダのファイル名や重複判定の状態はイベント間で保持する
+    ingester = Ingester(config, stats, hash_index, cache, report, snapshot, sandbox, coordinator=coordinator)
+    # 抽出のプロセスプールもイベントごとに作り直さず、監視を終えるまで使い回す
+    extract_workers = pipeline_options(config, workers)['extract_workers'] if use_pipeline else workers
+    executor = None
+    if sandbox is not None:
+        executor = ThreadPoolExecutor(max_workers=sandbox.workers)
+    elif use_pipeline or workers > 1:
+        executor = ProcessPoolExecutor(max_workers=extract_workers)
+    state = {'stop': False, 'waiting': False}
+    
+    def request_stop(signum, frame):
+        state['stop'] = True
+        # 処理中のファイルは最後まで処理してから終了する
+        if state['waiting']:
+            raise KeyboardInterrupt
+    
+    previous = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    logger.info("入力フォルダの監視を開始しました（Ctrl+Cで終了）")
+    try:
+        while not state['stop']:
+            state['waiting'] = True
+            try:
+                paths = watcher.wait(pending.timeout())
+            except KeyboardInterrupt:
+                break
+            finally:
+                state['waiting'] = False
+            for path in paths:
+                pending.add(path)
+            ready = pending.ready()
+            if ready:
+                before = stats['processed']
+                pdf_paths = [path for path in ready if not is_archive_name(path)]
+                archive_paths = [path for path in ready if is_archive_name(path)]
+                if use_pipeline and pdf_paths:
+                    process_pdf_files_pipelined(pdf_paths, config, stats, hash_index, workers, cache, report,
+                                                profile_dir, snapshot, sandbox, coordinator, ingester, executor)
+                elif pdf_paths:
+                    process_pdf_files(pdf_paths, config, stats, hash_index, workers, cache, report, profile_dir,
+                                      snapshot, ingester, executor=executor)
+                process_archive_files(archive_paths, config, stats, hash_index, cache, report, snapshot,
+                                      coordinator, ingester)
+                logger.info(f"{len(ready)}ファイルを検出し、{stats['processed'] - before}ファイルを処理しました")
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        if executor is not None:
+            executor.shutdown()
+        watcher.close()
+    logger.info("入力フォルダの監視を終了しました")
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        
+        config = load_config()
+        if config is None:
+            return
+        
+        input_folders = config['input_folders']
+        output_folder = config['output_folder']
+        processed_folder = config['processed_folder']
         
         # 入力フォルダが指定されていない場合はエラー
         if not input_folders:
             logger.error("入力フォルダが設定されていません。")
             return
         
-        # 相対パスを絶対パスに変換（出力フォルダ）
-        if not os.path.isabs(output_folder):
-            output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_folder)
+        # 上限を超えたファイルの扱いが不明な値の場合はエラー（fallbackとして処理を続けない）
+        budget = config.get('budget') or {}
+        on_exceed = budget.get('on_exceed', 'fallback') if isinstance(budget, dict) else 'fallback'
+        if on_exceed not in BUDGET_ACTIONS:
+            logger.error(f"budget.on_exceed の値が不正です: {on_exceed}（{' / '.join(BUDGET_ACTIONS)} のいずれかを指定してください）")
+            return
         
-        # 相対パスを絶対パスに変換（処理済みフォルダ）
-        if not os.path.isabs(processed_folder):
-            processed_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), processed_folder)
+        # 並列プロセス数（コマンドライン引数を優先）
+        workers = args.workers if args.workers is not None else config.get('workers', 1)
+        workers = max(1, int(workers or 1))
         
         # 出力フォルダと処理済みフォルダが存在しない場合は作成
         os.makedirs(output_folder, exist_ok=True)
         os.makedirs(processed_folder, exist_ok=True)
         
         # 処理状況のカウント
-        total_files = 0
-        processed_files = 0
-        skipped_files = 0
-        moved_files = 0
-        
-        # 処理済みファイルのハッシュを記録
-        processed_file_hashes = set()
-        
-        # 各入力フォルダを処理
-        for folder_path in input_folders:
-            # 相対パスを絶対パスに変換（入力フォルダ）
-            if not os.path.isabs(folder_path):
-                folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder_path)
-            
-            if not os.path.exists(folder_path):
-                logger.warning(f"指定された入力フォルダが存在しません: {folder_path}")
-                continue
-                
-            logger.info(f"フォルダを処理中: {folder_path}")
-            
-            # 入力フォルダ内のPDFファイルを再帰的に検索
-            for root, _, files in os.walk(folder_path):
-                for file in files:
-                    if file.lower().endswith('.pdf'):
-                        total_files += 1
-                        pdf_path = os.path.join(root, file)
-                        
-                        # ファイルハッシュを計算
-                        file_hash = None
-                        try:
-                            with open(pdf_path, 'rb') as f:
-                                file_hash = hashlib.md5(f.read()).hexdigest()
-                        except Exception as e:
-                            logger.error(f"ファイルハッシュ計算中にエラーが発生しました: {pdf_path} - {str(e)}")
-                        
-                        # すでに処理済みのファイルはスキップ
-                        if file_hash in processed_file_hashes:
-                            logger.info(f"重複ファイルのためスキップします: {pdf_path}")
-                            skipped_files += 1
-                            continue
-                        
-                        logger.info(f"処理中: {pdf_path}")
-                        
-                        try:
-                            # タイトルと著者を抽出
-                            title, author = extract_title_and_author(pdf_path)
-                            
-                            # 新しいファイル名を作成
-                            new_filename = f"{title}({author}).pdf"
-                            # ファイル名のサニタイズ
-                            new_filename = sanitize_filename(new_filename)
-                            
-                            # 出力先パス
-                            output_path = os.path.join(output_folder, new_filename)
-                            
-                            # 同名ファイルが存在する場合は連番を付加
-                            counter = 1
-                            original_name = os.path.splitext(new_filename)[0]
-                            while os.path.exists(output_path):
-                                new_filename = f"{original_name}_{counter}.pdf"
-                                output_path = os.path.join(output_folder, new_filename)
-                                counter += 1
-                            
-                            # ファイルをコピー
-                            shutil.copy2(pdf_path, output_path)
-                            logger.info(f"コピー完了: {output_path}")
-                            processed_files += 1
-                            
-                            # 処理済みハッシュに追加
-                            if file_hash:
-                                processed_file_hashes.add(file_hash)
-                            
-                            # 処理済みファイルを移動
-                            processed_filename = os.path.basename(pdf_path)
-                            processed_path = os.path.join(processed_folder, processed_filename)
-                            
-                            # 同名ファイルが移動先にある場合は連番を付加
-                            counter = 1
-                            while os.path.exists(processed_path):
-                                base_name, ext = os.path.splitext(processed_filename)
-                                processed_filename = f"{base_name}_{counter}{ext}"
-                                processed_path = os.path.join(processed_folder, processed_filename)
-                                counter += 1
-                            
-                            # ファイルを移動（コピー＋削除）
-                            try:
-                                shutil.move(pdf_path, processed_path)
-                                logger.info(f"移動完了: {pdf_path} → {processed_path}")
-                                moved_files += 1
-                            except Exception as e:
-                                logger.error(f"ファイル移動中にエラーが発生しました: {pdf_path} - {str(e)}")
-                        
-                        except Exception as e:
-                            logger.error(f"ファイル処理中にエラーが発生しました: {pdf_path} - {str(e)}")
-        
-        logger.info(f"処理完了: 合計{total_files}ファイル中、{processed_files}ファイルを処理し、{moved_files}ファイルを移動しました。{skipped_files}ファイルはスキップされました。")
+        stats = {'total': 0, 'processed': 0, 'skipped': 0, 'moved': 0, 'cached': 0,
+                 'parsed': 0, 'second_page': 0, 'metadata_only': 0, 'over_budget': 0, 'quarantined': 0,
+                 'near_duplicates': 0, 'newer_versions': 0, 'archives': 0}
+        
+        # 複数ノードで処理する場合、SQLiteのファイルはノードごとに分けて共有フォルダ上で同時に書き込まない
+        cluster = cluster_options(config, args)
+        state_folder = output_folder
+        if cluster is not None:
+            state_folder = os.path.join(cluster['dir'], 'nodes', cluster['node_id'])
+            os.makedirs(state_folder, exist_ok=True)
+        
+        # 過去の実行で処理したファイルのハッシュインデックス
+        index_path = resolve_path(config.get('index_path') or os.path.join(state_folder, '.paper_rename_index.sqlite3'))
+        hash_index = HashIndex(index_path, output_folder)
+        
+        # 抽出結果のキャッシュ（cache_max_entriesが0なら無効）
+        cache = None
+        cache_max_entries = int(config.get('cache_max_entries', 50000) or 0)
+        if cache_max_entries > 0:
+            cache_path = resolve_path(config.get('cache_path') or os.path.join(state_folder, '.paper_rename_cache.sqlite3'))
+            cache = ExtractionCache(cache_path, cache_max_entries, extractor_options(config))
+        
+        # 実行レポートとプロファイルの出力先
+        report = RunReport(args.slowest)
+        report_path = args.report or config.get('report_path')
+        profile_dir = args.profile_dir
+        if profile_dir:
+            profile_dir = resolve_path(profile_dir)
+            os.makedirs(profile_dir, exist_ok=True)
+        
+        # マニフェストの適用はPDFの走査・抽出を行わない
+        if args.apply:
+            try:
+                apply_manifest(resolve_path(args.apply), config, stats, hash_index, report,
+                               int(config.get('journal_batch_size', 64) or 64))
+            finally:
+                hash_index.close()
+                if cache is not None:
+                    cache.close()
+            if report_path:
+                report.write(resolve_path(report_path), stats)
+            logger.info(f"適用完了: {stats['processed']}ファイルを配置し、{stats['moved']}ファイルを移動しました。{stats['skipped']}ファイルはスキップされました。")
+            return
+        
+        # パイプライン処理（コマンドライン引数を優先）
+        pipeline = config.get('pipeline')
+        use_pipeline = args.pipeline or (isinstance(pipeline, dict) and bool(pipeline.get('enabled')))
+        manifest = PlanManifest(resolve_path(args.plan)) if args.plan else None
+        if manifest is not None and use_pipeline:
+            logger.info("マニフェストの作成ではパイプライン処理を使用しません")
+            use_pipeline = False
+        process = process_pdf_files_pipelined if use_pipeline else process_pdf_files
+        
+        # 抽出処理の時間・メモリの上限（どちらかを設定すると隔離されたワーカーで抽出する）
+        sandbox = None
+        budget = config.get('budget') or {}
+        if isinstance(budget, dict):
+            timeout = float(budget.get('timeout_seconds') or 0)
+            max_rss_mb = float(budget.get('max_rss_mb') or 0)
+            if timeout > 0 or max_rss_mb > 0:
+                sandbox_workers = pipeline_options(config, workers)['extract_workers'] if use_pipeline else workers
+                sandbox = ExtractionSandbox(sandbox_workers, timeout or None, int(max_rss_mb * 1024 * 1024) or None,
+                                            int(budget.get('max_tasks_per_worker', 100) or 0), profile_dir)
+        
+        # 前回の走査結果（incremental_scanがfalseなら毎回すべてのフォルダを読み込む）
+        exclude_folders = [output_folder, processed_folder, config['quarantine_folder']]
+        exclude_patterns = config.get('exclude') or []
+        follow_symlinks = bool(config.get('follow_symlinks', False))
+        snapshot = None
+        if config.get('incremental_scan', True):
+            snapshot_path = resolve_path(config.get('scan_snapshot_path')
+                                         or os.path.join(state_folder, '.paper_rename_scan.sqlite3'))
+            settings = {'input_folders': input_folders, 'exclude_folders': exclude_folders,
+                        'exclude': exclude_patterns, 'follow_symlinks': follow_symlinks}
+            snapshot = ScanSnapshot(snapshot_path, settings, reset=args.full_scan)
+        
+        # 監視モードでは最初の処理中に追加されたファイルも拾えるよう、先に監視を開始する
+        watcher = None
+        if args.watch:
+            watcher = create_watcher(config, input_folders, exclude_folders, exclude_patterns, follow_symlinks)
+        
+        coordinator = None
+        try:
+            if cluster is not None:
+                coordinator = ClusterCoordinator(cluster['dir'], cluster['node_id'], input_folders,
+                                                 cluster['lease_seconds'], cluster['shard_index'],
+                                                 cluster['shard_count'])
+                logger.info(f"ノード {cluster['node_id']} として処理します（シャード {cluster['shard_index']}/{cluster['shard_count']}）")
+                coordinator.merge_journals(hash_index)
+            # zip・tarの書庫は走査中に集めておき、通常のPDFの後で展開せずに処理する
+            archives = [] if archive_options(config) is not None else None
+            pdf_paths = iter_pdf_files(input_folders, exclude_folders, exclude_patterns, follow_symlinks, snapshot,
+                                       archives=archives)
+            if manifest is not None:
+                process(pdf_paths, config, stats, hash_index, workers, cache, report, profile_dir, snapshot,
+                        sandbox=sandbox, manifest=manifest, coordinator=coordinator)
+                manifest.close()
+                logger.info(f"マニフェストを出力しました: {manifest.path}（{manifest.count}件）")
+                if archives:
+                    logger.info(f"マニフェストの作成では書庫を処理しません（{len(archives)}件）。--plan を指定せずに実行してください")
+            else:
+                process(pdf_paths, config, stats, hash_index, workers, cache, report, profile_dir, snapshot,
+                        sandbox=sandbox, coordinator=coordinator)
+                process_archive_files(archives, config, stats, hash_index, cache, report, snapshot, coordinator)
+            if watcher is not None:
+                watch_input_folders(watcher, config, stats, hash_index, workers, cache, report, profile_dir,
+                                    snapshot, sandbox, coordinator, use_pipeline)
+        finally:
+            if watcher is not None:
+                watcher.close()
+            if coordinator is not None:
+                coordinator.close()
+            if sandbox is not None:
+                sandbox.close()
+            hash_index.close()
+            if cache is not None:
+                cache.close()
+        # 処理中にエラーが発生した場合は走査結果を保存しない（次回はすべて読み込み直す）
+        if snapshot is not None:
+            snapshot.close()
+        
+        if report_path:
+            report.write(resolve_path(report_path), stats)
+        
+        logger.info(f"処理完了: 合計{stats['total']}ファイル中、{stats['processed']}ファイルを処理し、{stats['moved']}ファイルを移動しました。{stats['skipped']}ファイルはスキップされました。（キャッシュ利用: {stats['cached']}ファイル）")
+        if stats['archives']:
+            logger.info(f"処理済みフォルダに移動した書庫: {stats['archives']}件")
+        if stats['over_budget']:
+            logger.info(f"抽出処理が上限を超えたファイル: {stats['over_budget']}ファイル（隔離: {stats['quarantined']}ファイル）")
+        if stats['near_duplicates'] or stats['newer_versions']:
+            logger.info(f"登録済みの論文と同じ可能性がある論文: {stats['near_duplicates']}ファイル（新しいバージョン: {stats['newer_versions']}ファイル）")
+        if coordinator is not None and coordinator.busy_elsewhere:
+            logger.info(f"他のノードが処理中のためスキップしたファイル: {coordinator.busy_elsewhere}ファイル")
+        if snapshot is not None and (snapshot.skipped_dirs or snapshot.skipped_files):
+            logger.info(f"前回の走査から変更のないフォルダ{snapshot.skipped_dirs}件とファイル{snapshot.skipped_files}件をスキップしました")
+        if stats['metadata_only']:
+            logger.info(f"メタデータのみで抽出したファイル: {stats['metadata_only']}ファイル")
+        if stats['parsed']:
+            logger.info(f"2ページ目の解析が必要だったファイル: {stats['parsed']}ファイル中{stats['second_page']}ファイル")
     
     except Exception as e:
         logger.error(f"実行中にエラーが発生しました: {str(e)}")
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paper_rename
+
+TITLE = "Addition is All You Need for Energy-efficient Language Models"
+AUTHOR = "Hongyin Luo"
+
+
+def register(hash_index, arxiv_id, output_filename):
+    """arXiv ID（バージョン付き）の論文を処理済みとしてインデックスに登録する"""
+    info = {'title': TITLE, 'author': AUTHOR, 'method': 'title:layout,author:after_title', 'arxiv_id': arxiv_id}
+    fingerprint = paper_rename.FileFingerprint(output_filename, len(output_filename), quick_hash=output_filename)
+    file_id = hash_index.record(fingerprint, output_filename, arxiv_id + '.pdf', TITLE, AUTHOR)
+    hash_index.record_paper(file_id, paper_rename.paper_features(info))
+
+
+def make_ingester(tmp_path, action):
+    output_folder = tmp_path / 'outputs'
+    processed_folder = tmp_path / 'processed'
+    output_folder.mkdir()
+    processed_folder.mkdir()
+    config = {'output_folder': str(output_folder), 'processed_folder': str(processed_folder),
+              'near_duplicates': {'enabled': True, 'on_duplicate': action, 'on_newer_version': action}}
+    hash_index = paper_rename.HashIndex(':memory:', str(output_folder))
+    register(hash_index, '2410.00907v2', 'v2.pdf')
+    register(hash_index, '2410.00907v3', 'v3.pdf')
+    return paper_rename.Ingester(config, {}, hash_index)
+
+
+def test_redownloaded_version_matches_same_version(tmp_path):
+    """v2とv3が登録済みのときにv2を再ダウンロードしても、v3より古いバージョンではなくv2の複製とみなす"""
+    ingester = make_ingester(tmp_path, 'group')
+    info = {'title': TITLE, 'author': AUTHOR, 'method': 'title:layout,author:after_title',
+            'arxiv_id': '2410.00907v2', 'sketch': None}
+    match = ingester.near_detector.find(paper_rename.paper_features(info))
+    assert match.relation == 'duplicate'
+    assert match.output_filename == 'v2.pdf'
+
+    ingester.check_near_duplicate('/inbox/2410.00907v2.pdf', info)
+    assert info['near_duplicate']['relation'] == 'duplicate'
+    assert info['near_duplicate']['filename'].endswith('_copy.pdf')
+
+
+def test_unseen_version_compares_with_latest(tmp_path):
+    """登録済みでないバージョンは最新の登録済みバージョンと比べる"""
+    ingester = make_ingester(tmp_path, 'flag')
+    for arxiv_id, relation in (('2410.00907v4', 'newer_version'), ('2410.00907v1', 'older_version')):
+        info = {'title': TITLE, 'author': AUTHOR, 'method': 'title:layout,author:after_title',
+                'arxiv_id': arxiv_id, 'sketch': None}
+        match = ingester.near_detector.find(paper_rename.paper_features(info))
+        assert match.relation == relation
+        assert match.output_filename == 'v3.pdf'